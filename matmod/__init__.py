@@ -0,0 +1,8 @@
+# Ring road traffic models.
+# model1..model4 are the models themselves, engine is the vectorized core they all run on. Importing
+# the package or any of its modules has no side effects: nothing is simulated and matplotlib is only
+# imported by the functions that draw. See cli.py for the command line (python -m matmod).
+
+from .engine import RULES, State, register_rule, run, step
+
+__all__ = ["RULES", "State", "register_rule", "run", "step"]
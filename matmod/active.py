@@ -0,0 +1,118 @@
+# Active set stepping for big rings with localized jams.
+# Most cars of a ring are in uniform free flow: they drive at v_max, the car in front of them
+# (as far as they remember) is at least as fast, so a step only moves them v_max * dt ahead. For
+# rules that accelerate past v_max behind a faster car (free_flow "equal" in engine.register_rule)
+# the car in front has to be exactly as fast, rules without a free_flow cannot be stepped here. ActiveSet
+# steps only the other, active, cars exactly like engine.step. A car goes to sleep once it has
+# been at v_max for longer than the reaction time history (so its whole history is v_max) and the
+# car in front of it is asleep as well. Sleeping cars are advanced in closed form from the
+# position they had when they fell asleep, and only when they are woken up again: as soon as the
+# car in front of them becomes active. The cost of a step is then proportional to the size of the
+# active region instead of the number of cars.
+#
+# The speeds are exactly those of engine.step. The position of a car that has slept is computed as
+# pos + v_max * dt * steps instead of adding v_max * dt every step, which can differ in the last
+# bits when v_max * dt is not exactly representable. Positions of sleeping cars in state.pos and the
+# history are only brought up to date by sync(), except for rules that need the gap to the car in
+# front (engine.GAP_RULES): there the sleeping cars in front of active cars are caught up every step.
+
+import types
+
+import numpy as np
+from . import engine
+
+class ActiveSet:
+    def __init__(self, state : engine.State) -> None:
+        if state.pos.ndim != 1:
+            raise ValueError("active set stepping works on a single ring, not on %s" % (state,))
+        if state.rule not in engine.FREE_FLOW_RULES:
+            raise ValueError("rule %s has no free_flow (engine.register_rule), active set stepping needs one" % state.rule)
+        self.state = state
+        self.equal = engine.FREE_FLOW_RULES[state.rule] == "equal"
+        n = state.n
+        self.follower = (np.arange(n) - 1) % n
+        leader_v_max = state.v_max[state.leader]
+        slower = (leader_v_max != state.v) if self.equal else (leader_v_max < state.v)
+        busy = (state.v != state.v_max) | np.any(state.hist_v != state.v_max, axis=0) | slower
+        # number of steps in a row each car has ended at v_max
+        self.calm = np.where(busy, 0, state.r_max + 1)
+        # the step at which the position in state.pos of a sleeping car was last brought up to date
+        self.since = np.full(n, state.k)
+        self.is_active = busy.copy()
+        self.act = np.flatnonzero(busy)
+        self._params = types.SimpleNamespace(dt=state.dt, scale=state.scale, den=state.den)
+
+    def __repr__(self) -> str:
+        return "ActiveSet(active=%i/%i, k=%i)" % (len(self.act), self.state.n, self.state.k)
+
+    def _catch_up(self, cars : np.ndarray) -> None:
+        # bring the positions and position history of sleeping cars up to date, without waking them
+        st = self.state
+        steps = st.k - self.since[cars]
+        speed = st.v[cars] * st.dt
+        # memory(j) is the state j + 1 steps ago, rows written before the car fell asleep are still right
+        for j in range(st.r_max):
+            ago = steps - 1 - j
+            slept = ago >= 0
+            row = (st.head - 1 - j) % st.r_max
+            st.hist_pos[row, cars[slept]] = (st.pos[cars[slept]] + speed[slept] * ago[slept]) % st.d_tot
+        moved = st.pos[cars] + speed * steps
+        st.lap[cars] += (moved // st.d_tot).astype(np.int64)
+        st.pos[cars] = moved % st.d_tot
+        self.since[cars] = st.k
+
+    def step(self) -> None:
+        st = self.state
+
+        # the cars behind active cars have to see them, wake them up
+        behind = self.follower[self.act]
+        woken = np.unique(behind[~self.is_active[behind]])
+        if len(woken):
+            self._catch_up(woken)
+            self.is_active[woken] = True
+            self.act = np.union1d(self.act, woken)
+        act = self.act
+
+        # engine.step for the active cars only
+        lag = (st.head - st.r[act]) % st.r_max
+        pre_v = st.hist_v[lag, st.leader[act]]
+        dist = None
+        if st.rule in engine.GAP_RULES:
+            # the gap needs the position of the car in front now, also when it sleeps. Caught up
+            # every step, its position then grows by v * dt a step like in engine.step.
+            leaders = st.leader[act]
+            asleep = leaders[~self.is_active[leaders]]
+            if len(asleep):
+                self._catch_up(np.unique(asleep))
+            dist = (st.pos[leaders] - st.pos[act]) % st.d_tot
+        st.hist_v[st.head, act] = st.v[act]
+        st.hist_pos[st.head, act] = st.pos[act]
+        st.head = (st.head + 1) % st.r_max
+
+        params = self._params
+        params.a, params.v_max, params.r, params.ret = st.a[act], st.v_max[act], st.r[act], st.ret[act]
+        v = engine.rule(st)(st.v[act], pre_v, dist, params)
+        st.v[act] = v
+        moved = st.pos[act] + v * st.dt
+        st.lap[act] += (moved // st.d_tot).astype(np.int64)
+        st.pos[act] = moved % st.d_tot
+        st.k += 1
+
+        # cars with only v_max in their history behind a sleeping car go to sleep
+        followed = (pre_v == v) if self.equal else (pre_v >= v)
+        calm = np.where((v == params.v_max) & followed, self.calm[act] + 1, 0)
+        self.calm[act] = calm
+        sleepy = act[(calm > st.r_max) & ~self.is_active[st.leader[act]]]
+        if len(sleepy):
+            self.is_active[sleepy] = False
+            self.since[sleepy] = st.k
+            self.act = act[self.is_active[act]]
+
+    def run(self, steps : int) -> None:
+        for _ in range(steps):
+            self.step()
+
+    def sync(self) -> engine.State:
+        # bring the whole state up to date, e.g. before reading positions or metrics from it
+        self._catch_up(np.flatnonzero(~self.is_active))
+        return self.state
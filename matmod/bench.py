@@ -0,0 +1,136 @@
+# Benchmarks of the engine step for every model rule.
+# For every rule in engine.RULES and every combination of number of cars, reaction time and
+# homogeneous or heterogeneous (dev() like) cars, a ring is set up at the density of model4 and
+# stepped for a fixed time budget. We record steps per second, percentiles of the time per step
+# and the peak memory of setting up and running the ring, and write them to a JSON file. The peak
+# memory comes from a separate short run under tracemalloc, which would slow the timed steps down.
+#
+#     python -m matmod.bench --out bench_results.json
+#     python -m matmod.bench --n 50 1000 --out new_results.json --compare bench_results.json
+#     python -m matmod.bench --rules-from myrules --rules mine model4
+#
+# With --compare every case is checked against a stored run, and cases that got slower than
+# --threshold are reported as regressions (exit code 1).
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from . import engine
+from . import model4
+
+N_GRID = (50, 1000, 10**4, 10**5, 10**6)
+R_GRID = (1, 4, 10, 40)
+GAP = 600 # distance between cars, D_TOT / N of model4
+V_MAX = 400
+ACCELERATION = 50
+RETARDATION = -50
+DT = 0.1
+
+def setup_ring(rule : str, n : int, r : int, heterogeneous : bool, seed : int = 0) -> engine.State:
+    # a ring of n cars with one of them slowed down, like setup_cars_set_parameters in model4,
+    # heterogeneous cars are drawn with the dev() of model4
+    v_max, reaction, acc, ret = model4.car_parameters(V_MAX, r, ACCELERATION, RETARDATION, n, heterogeneous, np.random.default_rng(seed))
+    state = engine.State(np.arange(n) * GAP, v_max, v_max, reaction, acc, ret, n * GAP, DT, rule)
+    state.v[min(7, n - 1)] /= 2
+    return state
+
+def peak_memory(rule : str, n : int, r : int, heterogeneous : bool, steps : int = 5) -> int:
+    # bytes allocated at most while setting up the ring and stepping it, the engine allocates
+    # everything it needs up front so a few steps are enough
+    tracemalloc.start()
+    state = setup_ring(rule, n, r, heterogeneous)
+    engine.run(state, steps)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+def run_case(rule : str, n : int, r : int, heterogeneous : bool, budget : float, max_steps : int) -> dict:
+    state = setup_ring(rule, n, r, heterogeneous)
+    times = []
+    total = time.perf_counter()
+    while len(times) < max_steps and (time.perf_counter() - total < budget or len(times) < 5):
+        start = time.perf_counter_ns()
+        engine.step(state)
+        times.append(time.perf_counter_ns() - start)
+    total = time.perf_counter() - total
+    peak = peak_memory(rule, n, r, heterogeneous)
+
+    times = np.array(times) / 1e3
+    return {
+        "rule": rule,
+        "n": n,
+        "r": r,
+        "heterogeneous": heterogeneous,
+        "steps": len(times),
+        "steps_per_s": len(times) / total,
+        "car_steps_per_s": n * len(times) / total,
+        "p50_us": float(np.percentile(times, 50)),
+        "p90_us": float(np.percentile(times, 90)),
+        "p99_us": float(np.percentile(times, 99)),
+        "peak_mb": peak / 2**20,
+    }
+
+def case_key(case : dict) -> tuple:
+    return case["rule"], case["n"], case["r"], case["heterogeneous"]
+
+def compare(results : list[dict], baseline : list[dict], threshold : float) -> list[str]:
+    # cases that are more than threshold slower (steps per second) than in the baseline
+    old = {case_key(case): case for case in baseline}
+    regressions = []
+    for case in results:
+        before = old.get(case_key(case))
+        if before is None:
+            continue
+        change = case["steps_per_s"] / before["steps_per_s"] - 1
+        if change < -threshold:
+            regressions.append("%s n=%i r=%i heterogeneous=%s: %.0f -> %.0f steps/s (%+.0f%%)"
+                               % (case["rule"], case["n"], case["r"], case["heterogeneous"], before["steps_per_s"], case["steps_per_s"], 100 * change))
+    return regressions
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="benchmark the engine step of the ring road models")
+    parser.add_argument("--rules-from", action="append", default=[], metavar="MODULE", help="import this module for the rules it registers")
+    parser.add_argument("--rules", nargs="+", help="all rules of engine.RULES by default")
+    parser.add_argument("--n", nargs="+", type=int, default=N_GRID)
+    parser.add_argument("--r", nargs="+", type=int, default=R_GRID)
+    parser.add_argument("--heterogeneous", nargs="+", choices=("on", "off"), default=("off", "on"))
+    parser.add_argument("--budget", type=float, default=0.3, help="seconds of stepping per case")
+    parser.add_argument("--max-steps", type=int, default=10000)
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--compare", help="JSON file of an earlier run to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative slowdown that counts as a regression")
+    args = parser.parse_args()
+    # read the baseline before --out, which may be the same file, is overwritten
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+    engine.import_rules(args.rules_from)
+
+    results = []
+    for rule in args.rules or sorted(engine.RULES):
+        for n in args.n:
+            for r in args.r:
+                for heterogeneous in args.heterogeneous:
+                    case = run_case(rule, n, r, heterogeneous == "on", args.budget, args.max_steps)
+                    results.append(case)
+                    print("%s n=%i r=%i heterogeneous=%s: %.0f steps/s, p50 %.0fus, p99 %.0fus, peak %.1fMB"
+                          % (rule, n, r, heterogeneous, case["steps_per_s"], case["p50_us"], case["p99_us"], case["peak_mb"]))
+
+    with open(args.out, "w") as f:
+        json.dump({"python": sys.version, "numpy": np.__version__, "machine": platform.machine(), "results": results}, f, indent=1)
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        for line in regressions:
+            print("REGRESSION", line)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
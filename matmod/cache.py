@@ -0,0 +1,53 @@
+# Content addressed on-disk cache for sweep results.
+# A scenario is a dict with everything that determines the result of a simulation (all setup
+# parameters, DT, D_TOT, start_k/stop_k, seed, rule and rule version). Its key is a hash of the
+# canonical JSON of that dict, so a sweep only has to simulate the points it has not seen before.
+# The results are kept in a single sqlite file, and the least recently used entries are evicted
+# once there are more than max_entries of them.
+
+import hashlib
+import json
+import sqlite3
+import time
+
+def key(scenario : dict) -> bytes:
+    text = json.dumps(scenario, sort_keys=True, default=lambda o: o.item())
+    return hashlib.blake2b(text.encode(), digest_size=16).digest()
+
+class Cache:
+    def __init__(self, path : str, max_entries : int = 1_000_000) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS results (key BLOB PRIMARY KEY, wave_size INTEGER, wave_speed REAL, used REAL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS results_used ON results (used)")
+
+    def __repr__(self) -> str:
+        return "Cache(path=%s, entries=%i, max_entries=%i)" % (self.path, len(self), self.max_entries)
+
+    def __len__(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def get_many(self, keys : list[bytes]) -> list[tuple[int, float] | None]:
+        # the (wave_size, wave_speed) of every key, or None where it is missing
+        found = {}
+        for i in range(0, len(keys), 500):
+            batch = keys[i:i + 500]
+            rows = self.db.execute("SELECT key, wave_size, wave_speed FROM results WHERE key IN (%s)" % ",".join("?" * len(batch)), batch)
+            # sqlite stores nan (no wave) as NULL
+            found.update((k, (size, float("nan") if speed is None else speed)) for k, size, speed in rows)
+        with self.db:
+            self.db.executemany("UPDATE results SET used = ? WHERE key = ?", [(time.time(), k) for k in found])
+        return [found.get(k) for k in keys]
+
+    def put_many(self, keys : list[bytes], wave_size : list[int], wave_speed : list[float]) -> None:
+        now = time.time()
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                                [(k, int(size), float(speed), now) for k, size, speed in zip(keys, wave_size, wave_speed)])
+            excess = len(self) - self.max_entries
+            if excess > 0:
+                self.db.execute("DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY used LIMIT ?)", (excess,))
+
+    def close(self) -> None:
+        self.db.close()
@@ -0,0 +1,86 @@
+# Checkpoints of the complete simulation state.
+# A checkpoint is an uncompressed .npz with every array of an engine.State (positions, speeds,
+# laps, per-car parameters and the reaction time history buffer with its head), the step counter,
+# the ring parameters and the state of a random generator that the run draws from, so a run
+# restored from it continues bit for bit like the original one. The same checkpoint can be
+# loaded any number of times to fork what-if runs from one warmed-up state. Fixed point states
+# (engine.State with a scale) are saved in their integers and come back as fixed point states.
+
+import glob
+import json
+import os
+import re
+
+import numpy as np
+from . import engine
+
+ARRAYS = ("pos", "v", "v_max", "r", "a", "ret", "lap", "counts", "hist_v", "hist_pos")
+
+def save(state : engine.State, path : str, rng=None) -> None:
+    # rng is a np.random.Generator, or None for the global np.random state
+    data = {name: getattr(state, name) for name in ARRAYS}
+    meta = {"k": state.k, "head": state.head, "d_tot": state.d_tot, "dt": state.dt, "rule": state.rule, "scale": state.scale, "den": state.den}
+    if rng is None:
+        kind, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+        data["rng_keys"] = keys
+        meta["rng"] = {"kind": kind, "pos": pos, "has_gauss": has_gauss, "cached_gaussian": cached_gaussian}
+    else:
+        meta["rng"] = {"generator": rng.bit_generator.state}
+    data["meta"] = np.array(json.dumps(meta, default=int))
+
+    # write next to the target and rename, so a run killed while saving leaves the old checkpoint intact
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        np.savez(f, **data)
+    os.replace(tmp, path)
+
+def load(path : str, rng=None, restore_rng : bool = True) -> engine.State:
+    # the state saved at path, also restoring the random state into rng (or the global np.random)
+    with np.load(path) as data:
+        meta = json.loads(str(data["meta"]))
+        scale, den = meta.get("scale"), meta.get("den", 1)
+        # fixed point states go through the units of the models, State rounds them back exactly
+        speed, acc, unit = (1, 1, 1) if scale is None else (scale, scale // den, scale * den)
+        state = engine.State(data["pos"] / unit, data["v"] / speed, data["v_max"] / speed, data["r"], data["a"] / acc, data["ret"] / acc,
+                             meta["d_tot"] // unit, meta["dt"] / den, meta["rule"],
+                             hist_v=data["hist_v"][::-1] / speed, hist_pos=data["hist_pos"][::-1] / unit, counts=data["counts"], lap=data["lap"], scale=scale)
+        state.head = meta["head"]
+        state.k = meta["k"]
+        if restore_rng:
+            saved = meta["rng"]
+            if "generator" in saved:
+                if rng is None:
+                    raise ValueError("%s holds the state of a np.random.Generator, pass one to restore it into" % path)
+                rng.bit_generator.state = saved["generator"]
+            elif rng is None:
+                np.random.set_state((saved["kind"], data["rng_keys"], saved["pos"], saved["has_gauss"], saved["cached_gaussian"]))
+    return state
+
+class Checkpointer:
+    # Saves a checkpoint every every steps to path % k (e.g. "run_%08i.npz"), keeping the last keep.
+    def __init__(self, path : str, every : int, keep : int = 2, rng=None) -> None:
+        self.path = path
+        self.every = every
+        self.keep = keep
+        self.rng = rng
+        self.saved = []
+
+    def __repr__(self) -> str:
+        return "Checkpointer(path=%s, every=%i, keep=%i)" % (self.path, self.every, self.keep)
+
+    def __call__(self, state : engine.State) -> bool:
+        # call after every step, returns if a checkpoint was written
+        if state.k % self.every != 0:
+            return False
+        path = self.path % state.k
+        save(state, path, self.rng)
+        self.saved.append(path)
+        while len(self.saved) > self.keep:
+            os.remove(self.saved.pop(0))
+        return True
+
+def latest(path : str) -> str | None:
+    # the newest checkpoint written by a Checkpointer with this path pattern, to resume from
+    # by time, saves within the resolution of the clock by name, which is by step with a padded %08i
+    found = sorted(glob.glob(re.sub(r"%0?\d*i", "*", path)), key=lambda found: (os.path.getmtime(found), found))
+    return found[-1] if found else None
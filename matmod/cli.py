@@ -0,0 +1,327 @@
+# Command line interface, python -m matmod <command>.
+#
+#     python -m matmod run model3 --n 100 --reaction-time 6
+#     python -m matmod run model4 --steps 2000 --record run.npy --every 5
+#     python -m matmod run model4 --steps 100000 --checkpoint-every 10000
+#     python -m matmod run model4 --steps 100000 --checkpoint-every 10000 --resume latest
+#     python -m matmod run model3 --background
+#     python -m matmod view psm_1234abcd --views wave
+#     python -m matmod sweep --grid reaction_time=2:10 --grid n=20,50 --start-k 30 --stop-k 100
+#     python -m matmod sweep --grid acceleration,retardation=20/-20,30/-30,40/-40 --stop-k 5000
+#     python -m matmod sweep --grid heterogeneous=1 --grid sample=0:1000 --seed 1 --start-k 30 --stop-k 100
+#     python -m matmod critical v_max 200 1200 --over reaction_time=1:9 --min-size 10
+#     python -m matmod --rules-from myrules sweep --rule mine --grid reaction_time=2:10 --stop-k 5000
+#     python -m matmod fundamental --n 10:401:5 --out fundamental.json
+#     python -m matmod render run.npy run.mp4 --fps 30
+#
+# Only run without --steps, run --background and view open windows, the other commands never
+# import pyplot. The parameter flags of run set the module constants of the model (N, V_MAX, ...)
+# before its cars are set up.
+# --rules-from imports modules that add rules with engine.register_rule, for --rule of run, sweep
+# and critical and --rules of fundamental.
+
+import argparse
+import importlib
+import inspect
+import json
+import time
+
+import numpy as np
+
+MODELS = ("model1", "model2", "model3", "model4")
+# shared.VIEWS
+VIEWS = ("ring", "speeds", "wave")
+
+# parameter flags, their type and the module constants they set (model1 calls DT dt)
+PARAMETERS = {
+    "n": (int, ("N",)),
+    "v_max": (int, ("V_MAX",)),
+    "d_tot": (int, ("D_TOT",)),
+    "reaction_time": (int, ("REACTION_TIME",)),
+    "acceleration": (int, ("ACCELERATION",)),
+    "retardation": (int, ("RETARDATION",)),
+    "dt": (float, ("DT", "dt")),
+    "heterogeneous": (bool, ("HETEROGENEOUS",)),
+    "seed": (int, ("SEED",)),
+}
+
+def setup_arguments(model) -> set:
+    # model4 takes its parameters as arguments, the other models read their module constants
+    if hasattr(model, "setup_cars_set_parameters"):
+        return set(inspect.signature(model.setup_cars_set_parameters).parameters) | {"seed"}
+    return set()
+
+def load_model(name : str, params : dict):
+    # the model module with its constants set to params
+    model = importlib.import_module("." + name, __package__)
+    for param, value in params.items():
+        constant = next((constant for constant in PARAMETERS[param][1] if hasattr(model, constant)), None)
+        if constant is not None:
+            setattr(model, constant, value)
+        elif param not in setup_arguments(model):
+            raise SystemExit("%s has no parameter %s" % (name, param))
+    return model
+
+def setup_state(model, params : dict):
+    accepted = setup_arguments(model)
+    if not accepted:
+        return model.setup_state()
+    arguments = {param: value for param, value in params.items() if param in accepted and param != "seed"}
+    return model.setup_state(rng=np.random.default_rng(params.get("seed")), **arguments)
+
+def check_rule(rule : str) -> None:
+    from . import engine
+    if rule not in engine.RULES:
+        raise SystemExit("unknown rule %s, one of %s" % (rule, ", ".join(engine.RULES)))
+
+def number(text : str) -> int | float:
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+def parse_grid(specs : list[str], allowed) -> dict:
+    # name=start:stop[:step] or name=v1,v2,... ; a,b=a1/b1,a2/b2 varies a and b together
+    grid = {}
+    for spec in specs:
+        names, _, values = spec.partition("=")
+        names = tuple(names.split(","))
+        for name in names:
+            if name not in allowed:
+                raise SystemExit("unknown parameter %s in --grid %s, one of %s" % (name, spec, ", ".join(allowed)))
+        if len(names) > 1:
+            grid[names] = [tuple(number(v) for v in value.split("/")) for value in values.split(",")]
+        elif ":" in values:
+            grid[names[0]] = list(range(*(int(v) for v in values.split(":"))))
+        else:
+            grid[names[0]] = [number(v) for v in values.split(",")]
+    return grid
+
+def run_command(args) -> None:
+    from . import checkpoint, engine, ensemble, live, record
+
+    params = {param: getattr(args, param) for param in PARAMETERS if getattr(args, param) is not None}
+    model = load_model(args.model, params)
+    pattern = args.checkpoint or args.model + "_%08i.npz"
+    resume = checkpoint.latest(pattern) if args.resume == "latest" else args.resume
+    if args.resume == "latest" and resume is None:
+        raise SystemExit("no checkpoint matching %s to resume from" % pattern)
+    state = checkpoint.load(resume) if resume else setup_state(model, params)
+    if args.rule:
+        check_rule(args.rule)
+        state.rule = args.rule
+
+    if args.steps is None and not args.background:
+        # the windows draw floats, also from a fixed point checkpoint
+        state = state.to_float()
+        if hasattr(model, "draw") and state.n <= getattr(model, "BINNED_VIEW_N", state.n):
+            model.draw(state)
+        else:
+            live.show(state, steps=getattr(model, "STEPS_PER_FRAME", None))
+        return
+
+    if args.scale:
+        if args.record:
+            raise SystemExit("--scale does not work with --record")
+        state = state.rescaled(args.scale)
+    if args.checkpoint_every and (args.record or args.background):
+        raise SystemExit("--checkpoint-every does not work with --record or --background")
+    if args.background:
+        if args.record or args.save:
+            raise SystemExit("--background does not work with --record or --save")
+        background(state, args.steps, args.views)
+        return
+    start = time.perf_counter()
+    if args.record:
+        record.record(state, args.steps, args.record, every=args.every)
+    elif args.checkpoint_every:
+        checkpointer = checkpoint.Checkpointer(pattern, args.checkpoint_every)
+        for _ in range(args.steps):
+            engine.step(state)
+            checkpointer(state)
+    else:
+        engine.run(state, args.steps)
+    elapsed = time.perf_counter() - start
+    # a fixed point run, also one resumed from a fixed point checkpoint, is summed up in floats
+    state = state.to_float()
+    if args.save:
+        checkpoint.save(state, args.save)
+    print(json.dumps({
+        "model": args.model,
+        "rule": state.rule,
+        "k": state.k,
+        "wave_size": int(ensemble.wave_size(state)),
+        "min_v": float(state.v.min()),
+        "mean_v": float(state.v.mean()),
+        "steps_per_s": args.steps / elapsed if elapsed > 0 else None,
+    }))
+
+def background(state, steps : int, views : list[str]) -> None:
+    # step state in a background process, shown by views in this one until their windows are closed
+    from . import shared
+
+    simulation = shared.Simulation(state, steps=steps)
+    simulation.start()
+    print("simulating in the background, more views with: python -m matmod view %s" % simulation.name)
+    try:
+        shared.show(simulation.snapshots, views)
+    finally:
+        simulation.close()
+
+def view_command(args) -> None:
+    from . import shared
+
+    try:
+        snapshots = shared.Snapshots.attach(args.name)
+    except FileNotFoundError:
+        raise SystemExit("no simulation %s is running" % args.name)
+    shared.show(snapshots, args.views)
+    snapshots.close()
+
+def sweep_command(args) -> None:
+    from . import cache, model4, sweep
+
+    check_rule(args.rule)
+    grid = parse_grid(args.grid, (set(inspect.signature(model4.setup_cars_set_parameters).parameters) - {"rng"}) | {"sample"})
+    stop_k = args.stop_k if args.stop_k is not None else 10000
+    results = sweep.run(grid, args.start_k, stop_k, workers=args.workers, chunk_size=args.chunk_size,
+                        cache=None if args.no_cache else cache.Cache(args.cache or model4.CACHE_PATH), seed=args.seed, spectral=args.spectral, rule=args.rule)
+    points = [dict(params, wave_size=int(size), wave_speed=float(speed))
+              for params, size, speed in zip(sweep.grid_points(grid), results[0].ravel(), results[1].ravel())]
+    for point in points:
+        print(point)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"rule": args.rule, "start_k": args.start_k, "stop_k": stop_k, "seed": args.seed, "points": points}, f, indent=1)
+
+def critical_command(args) -> None:
+    from . import cache, model4, stability, sweep
+
+    check_rule(args.rule)
+    allowed = set(inspect.signature(model4.setup_cars_set_parameters).parameters) - {"rng"}
+    over = parse_grid(args.over, allowed) if args.over else None
+    fixed = {name: values[0] for name, values in parse_grid(args.fixed, allowed).items()}
+    values, simulations = stability.critical(args.parameter, number(args.low), number(args.high), over=over, fixed=fixed, min_size=args.min_size,
+                                             tol=number(args.tol), max_k=args.max_k, workers=args.workers, seed=args.seed, verbose=False, rule=args.rule,
+                                             cache=None if args.no_cache else cache.Cache(args.cache or model4.CACHE_PATH))
+    for point, value in zip(sweep.grid_points(over) if over else [{}], np.ravel(values)):
+        print(dict(point, **{"critical_" + args.parameter: float(value)}))
+    print("%i simulations" % simulations)
+
+def fundamental_command(args) -> None:
+    from . import flow, model4
+
+    allowed = set(inspect.signature(model4.setup_cars_set_parameters).parameters) - {"rng", "n"}
+    fixed = {name: values[0] for name, values in parse_grid(args.fixed, allowed).items()}
+    ns = parse_grid(["n=" + args.n], {"n"})["n"]
+    for rule in args.rules or ():
+        check_rule(rule)
+    diagrams = flow.diagrams(ns, args.rules, warmup=args.warmup, steps=args.steps, loops=args.loops, workers=args.workers, **fixed)
+    for rule, diagram in diagrams.items():
+        for n, density, q, v in zip(diagram["n"], diagram["density"], diagram["flow"], diagram["speed"]):
+            print("%s n=%i density=%.5f flow=%.4f speed=%.2f" % (rule, n, density, q, v))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(diagrams, f, indent=1)
+
+def render_command(args) -> None:
+    from . import render
+
+    options = dict(start=args.start, stop=args.stop, every=args.every, ring=args.ring, dpi=args.dpi, workers=args.workers)
+    if args.frames:
+        print("%i frames written to %s" % (render.render_frames(args.recording, args.out, **options), args.out))
+    else:
+        try:
+            render.render_video(args.recording, args.out, fps=args.fps, **options)
+        except RuntimeError as error:
+            raise SystemExit(error)
+
+def main(argv : list[str] = None) -> None:
+    parser = argparse.ArgumentParser(prog="matmod", description="ring road traffic models")
+    parser.add_argument("--rules-from", action="append", default=[], metavar="MODULE", help="import this module for the rules it registers")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run a model, in a window unless --steps is given")
+    run_parser.add_argument("model", choices=MODELS)
+    for param, (kind, _) in PARAMETERS.items():
+        if kind is bool:
+            run_parser.add_argument("--" + param.replace("_", "-"), dest=param, action="store_const", const=True)
+        else:
+            run_parser.add_argument("--" + param.replace("_", "-"), dest=param, type=kind)
+    run_parser.add_argument("--steps", type=int, help="run this many steps without a window and print a summary")
+    run_parser.add_argument("--record", help="record the run to this .npy file, see record.py")
+    run_parser.add_argument("--every", type=int, default=1, help="record every this many steps")
+    run_parser.add_argument("--resume", help="start from this checkpoint instead of the model's set up, latest for the newest of --checkpoint")
+    run_parser.add_argument("--save", help="save a checkpoint of the final state here")
+    run_parser.add_argument("--checkpoint-every", type=int, help="save a checkpoint every this many steps, keeping the last two of the run")
+    run_parser.add_argument("--checkpoint", help="path of the checkpoints with %%i for the step, default MODEL_%%08i.npz")
+    run_parser.add_argument("--rule", help="step with this rule of engine.RULES instead of the model's own")
+    run_parser.add_argument("--background", action="store_true", help="step in a background process at full speed, see shared.py")
+    run_parser.add_argument("--views", nargs="+", choices=VIEWS, default=VIEWS, help="views of --background")
+    run_parser.add_argument("--scale", type=int, help="run in fixed point with speeds in units of 1/scale, see engine.py")
+    run_parser.set_defaults(handler=run_command)
+
+    view_parser = commands.add_parser("view", help="attach views to a simulation of run --background")
+    view_parser.add_argument("name", help="the name that run --background printed")
+    view_parser.add_argument("--views", nargs="+", choices=VIEWS, default=VIEWS)
+    view_parser.set_defaults(handler=view_command)
+
+    sweep_parser = commands.add_parser("sweep", help="wave size and speed of model4 over a parameter grid")
+    sweep_parser.add_argument("--grid", action="append", required=True, metavar="NAME=VALUES", help="start:stop[:step] or comma separated values")
+    sweep_parser.add_argument("--start-k", type=int, help="start of the measurement, leave out to run every point until it is steady")
+    sweep_parser.add_argument("--stop-k", type=int, help="end of the measurement, or the maximum number of steps when steady")
+    sweep_parser.add_argument("--rule", default="model4", help="rule of engine.RULES the cars follow")
+    sweep_parser.add_argument("--spectral", action="store_true", help="wave speed from the speed field, see spectral.py")
+    sweep_parser.add_argument("--workers", type=int)
+    sweep_parser.add_argument("--chunk-size", type=int)
+    sweep_parser.add_argument("--seed", type=int)
+    sweep_parser.add_argument("--cache", help="sqlite result cache, model4.CACHE_PATH by default")
+    sweep_parser.add_argument("--no-cache", action="store_true")
+    sweep_parser.add_argument("--out", help="write the results to this JSON file")
+    sweep_parser.set_defaults(handler=sweep_command)
+
+    critical_parser = commands.add_parser("critical", help="bisect for the value of a model4 parameter where the wave starts to persist")
+    critical_parser.add_argument("parameter")
+    critical_parser.add_argument("low")
+    critical_parser.add_argument("high")
+    critical_parser.add_argument("--over", action="append", default=[], metavar="NAME=VALUES", help="search for every point of this grid, like sweep --grid")
+    critical_parser.add_argument("--fixed", action="append", default=[], metavar="NAME=VALUE")
+    critical_parser.add_argument("--min-size", type=int, default=1, help="the wave persists if at least this many cars are in it")
+    critical_parser.add_argument("--tol", default="1")
+    critical_parser.add_argument("--max-k", type=int, default=5000)
+    critical_parser.add_argument("--rule", default="model4", help="rule of engine.RULES the cars follow")
+    critical_parser.add_argument("--workers", type=int)
+    critical_parser.add_argument("--seed", type=int)
+    critical_parser.add_argument("--cache", help="sqlite result cache, model4.CACHE_PATH by default")
+    critical_parser.add_argument("--no-cache", action="store_true")
+    critical_parser.set_defaults(handler=critical_command)
+
+    fundamental_parser = commands.add_parser("fundamental", help="flow against density for every rule on the ring of model4")
+    fundamental_parser.add_argument("--n", default="10:401:5", help="numbers of cars, start:stop[:step] or comma separated")
+    fundamental_parser.add_argument("--rules", nargs="+")
+    fundamental_parser.add_argument("--fixed", action="append", default=[], metavar="NAME=VALUE")
+    fundamental_parser.add_argument("--warmup", type=int, default=1000)
+    fundamental_parser.add_argument("--steps", type=int, default=2000, help="steps the flow is averaged over")
+    fundamental_parser.add_argument("--loops", type=int, default=4, help="loop detectors on the ring")
+    fundamental_parser.add_argument("--workers", type=int)
+    fundamental_parser.add_argument("--out", help="write the diagrams to this JSON file")
+    fundamental_parser.set_defaults(handler=fundamental_command)
+
+    render_parser = commands.add_parser("render", help="render a recording to a video, or to PNG frames with --frames")
+    render_parser.add_argument("recording")
+    render_parser.add_argument("out")
+    render_parser.add_argument("--frames", action="store_true", help="write PNG frames to the directory out instead of a video")
+    render_parser.add_argument("--fps", type=int, default=25)
+    render_parser.add_argument("--start", type=int, default=0)
+    render_parser.add_argument("--stop", type=int)
+    render_parser.add_argument("--every", type=int, default=1)
+    render_parser.add_argument("--ring", type=int, default=0)
+    render_parser.add_argument("--dpi", type=int, default=100)
+    render_parser.add_argument("--workers", type=int)
+    render_parser.set_defaults(handler=render_command)
+
+    args = parser.parse_args(argv)
+    if args.rules_from:
+        from . import engine
+        engine.import_rules(args.rules_from)
+    args.handler(args)
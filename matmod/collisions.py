@@ -0,0 +1,91 @@
+# Collision and near miss detection.
+# After every step the gap of every car to the car in front is computed once from the unwrapped
+# positions (engine.State.unwrapped), so it is also right where the ring wraps around at D_TOT.
+# A crash is a gap <= 0 (the car has reached or passed the car in front), a near miss a gap
+# below near_gap. Only the step where a car gets into either situation is logged, as an event in
+# a structured array, optionally appended to a binary event file that np.fromfile(path,
+# EVENT_DTYPE) reads back.
+
+import numpy as np
+
+CRASH = 0
+NEAR_MISS = 1
+
+EVENT_DTYPE = np.dtype([
+    ("k", "<i8"),
+    ("kind", "<i1"),
+    ("ring", "<i4"),
+    ("follower", "<i4"),
+    ("leader", "<i4"),
+    ("gap", "<f8"),
+    ("dv", "<f8"),
+])
+
+def unwrapped_gap(state) -> np.ndarray:
+    x = state.unwrapped()
+    return np.take(x, state.leader) + state.lead_lap * state.d_tot - x
+
+class CollisionLog:
+    def __init__(self, state, near_gap : float = 0.0, path : str = None) -> None:
+        self.near_gap = near_gap
+        self.path = path
+        self.file = open(path, "wb") if path is not None else None
+        self.chunks = []
+        self.steps = 0
+        self.counts = {"crashes": 0, "near_misses": 0}
+        self.crashed = np.zeros(state.shape, dtype=bool)
+        self.near = np.zeros(state.shape, dtype=bool)
+        self.followers = set()
+
+    def __repr__(self) -> str:
+        return "CollisionLog(steps=%i, crashes=%i, near_misses=%i)" % (self.steps, self.counts["crashes"], self.counts["near_misses"])
+
+    def check(self, state) -> int:
+        # log the new crashes and near misses after a step, returns the number of new events
+        gap = unwrapped_gap(state)
+        crashed = state.mask & (gap <= 0)
+        near = state.mask & ~crashed & (gap < self.near_gap)
+        new_crash = crashed & ~self.crashed
+        new_near = near & ~self.near
+        self.crashed, self.near = crashed, near
+        self.steps += 1
+        if not (new_crash.any() or new_near.any()):
+            return 0
+
+        events = np.concatenate([self._events(state, gap, new_crash, CRASH), self._events(state, gap, new_near, NEAR_MISS)])
+        self.counts["crashes"] += int(new_crash.sum())
+        self.counts["near_misses"] += int(new_near.sum())
+        self.followers.update(zip(events["ring"][events["kind"] == CRASH].tolist(), events["follower"][events["kind"] == CRASH].tolist()))
+        if self.file is not None:
+            self.file.write(events.tobytes())
+        else:
+            self.chunks.append(events)
+        return len(events)
+
+    def _events(self, state, gap : np.ndarray, which : np.ndarray, kind : int) -> np.ndarray:
+        flat = np.flatnonzero(which)
+        leader = state.leader.ravel()[flat]
+        events = np.zeros(len(flat), dtype=EVENT_DTYPE)
+        events["k"] = state.k
+        events["kind"] = kind
+        events["ring"] = flat // state.n
+        events["follower"] = flat % state.n
+        events["leader"] = leader % state.n
+        events["gap"] = gap.ravel()[flat]
+        events["dv"] = state.v.ravel()[flat] - state.v.ravel()[leader]
+        return events
+
+    def events(self) -> np.ndarray:
+        if self.path is not None:
+            if self.file is not None:
+                self.file.flush()
+            return np.fromfile(self.path, dtype=EVENT_DTYPE)
+        return np.concatenate(self.chunks) if self.chunks else np.zeros(0, dtype=EVENT_DTYPE)
+
+    def summary(self) -> dict:
+        return dict(self.counts, steps=self.steps, cars_crashed=len(self.followers))
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
@@ -0,0 +1,280 @@
+# Shared vectorized engine for the ring road models.
+# Instead of one Car object per car and a fresh MemCell per car per step, the state of all cars
+# lives in contiguous numpy arrays (structure of arrays) and the move() rules of the models are
+# applied to every car at once with masked array updates.
+
+import fractions
+import importlib
+
+import numpy as np
+
+# All per-car arrays have shape (n,) for a single ring, or (B, n) for an ensemble of B rings that
+# are stepped together (see ensemble.py). Rings with fewer than n cars are padded at the end:
+# counts gives the number of real cars per ring and mask marks them.
+#
+# With a scale the state is kept in fixed point instead of floats: with dt = num/den as a fraction,
+# speeds (v, v_max) are integers in units of 1/scale, accelerations (a, ret) in units of
+# den/scale and positions (pos, d_tot) in units of 1/(scale * den), and dt is num. Then v * dt,
+# a * dt and the modulo d_tot are exact integer operations, so results do not depend on the order
+# of any float operations, and the arrays are int32 (half the memory of float64) unless the ring
+# is too long for that. to_float() converts back for measuring and drawing.
+
+class State:
+    def __init__(self, pos, v, v_max, r, a, ret, d_tot : int, dt : float, rule : str = "model3", hist_v=None, hist_pos=None, counts=None, lap=None, scale : int = None) -> None:
+        self.pos = np.array(pos, dtype=float)
+        self.v = np.array(v, dtype=float)
+        self.v_max = np.array(v_max, dtype=float)
+        self.r = np.array(r, dtype=np.int64)
+        self.a = np.array(a, dtype=float)
+        self.ret = np.array(ret, dtype=float)
+        self.shape = self.pos.shape
+        self.n = self.shape[-1]
+        self.size = self.pos.size
+        self.d_tot = d_tot
+        self.dt = dt
+        self.rule = rule
+        self.k = 0
+
+        # the car in front of car i is car i + 1, the last car follows the first one.
+        # leader holds flat indices into the (B, n) arrays, padding cars follow themselves
+        i = np.arange(self.n)
+        self.counts = np.full(self.shape[:-1], self.n) if counts is None else np.array(counts, dtype=np.int64)
+        self.mask = i < self.counts[..., None]
+        rows = np.arange(self.size // self.n).reshape(self.shape[:-1] + (1,))
+        self.leader = rows * self.n + np.where(self.mask, (i + 1) % np.maximum(self.counts[..., None], 1), i)
+
+        # pos is kept in [0, d_tot), lap counts how many times each car went around the ring, so
+        # pos + lap * d_tot is the unwrapped position. The leader of the last car is one lap ahead.
+        self.lap = np.zeros(self.shape, dtype=np.int64) if lap is None else np.array(lap, dtype=np.int64)
+        self.lead_lap = (self.mask & (i == self.counts[..., None] - 1)).astype(np.int64)
+        self._wraps = np.empty(self.shape)
+
+        # The reaction time history is a fixed (r_max, n) ring buffer that is written in place.
+        # Row head is the next one to be overwritten, so memory[k] of the models (the state k + 1
+        # steps ago) is row (head - 1 - k) % r_max. hist_v/hist_pos arguments are given in the
+        # order of the models' memory, most recent row first.
+        r_max = int(self.r.max()) if hist_v is None else len(hist_v)
+        self.r_max = r_max
+        self.head = 0
+        hist_shape = (r_max,) + self.shape
+        self.hist_v = np.broadcast_to(self.v, hist_shape).copy() if hist_v is None else np.array(hist_v, dtype=float)[::-1].copy()
+        self.hist_pos = np.broadcast_to(self.pos, hist_shape).copy() if hist_pos is None else np.array(hist_pos, dtype=float)[::-1].copy()
+
+        # flat index into hist_v of memory[car.r - 1][(i + 1) % N] when head == 0, and buffers for the gather
+        self._lag_base = ((-self.r) % r_max) * self.size + self.leader
+        self._lag_idx = np.empty(self.shape, dtype=np.int64)
+        self._pre_v = np.empty(self.shape)
+
+        self.scale = scale
+        self.den = 1
+        self.unit = 1
+        if scale is not None:
+            self._to_fixed(scale)
+
+    def _to_fixed(self, scale : int) -> None:
+        dt = fractions.Fraction(self.dt).limit_denominator(1_000_000)
+        if scale % dt.denominator:
+            raise ValueError("scale %i has to be a multiple of %i, the denominator of dt = %s" % (scale, dt.denominator, dt))
+        self.den = dt.denominator
+        self.unit = scale * self.den
+        # the largest position before the modulo is below d_tot + v_max * dt
+        largest = (self.d_tot + float(np.max(np.abs(self.v_max), initial=0)) * float(dt) + 1) * self.unit
+        dtype = np.int32 if largest < 2**31 else np.int64
+
+        def fixed(values, unit):
+            return np.round(values * unit).astype(dtype)
+
+        self.pos, self.hist_pos = fixed(self.pos, self.unit), fixed(self.hist_pos, self.unit)
+        self.v, self.v_max, self.hist_v = fixed(self.v, scale), fixed(self.v_max, scale), fixed(self.hist_v, scale)
+        self.a, self.ret = fixed(self.a, scale // self.den), fixed(self.ret, scale // self.den)
+        self.d_tot = self.d_tot * self.unit
+        self.dt = dt.numerator
+        self._pre_v = np.empty(self.shape, dtype=dtype)
+        self._wraps = np.empty(self.shape, dtype=np.int64)
+
+    def __repr__(self) -> str:
+        return "State(shape=%s, k=%i, d_tot=%i, dt=%g, rule=%s)" % (self.shape, self.k, self.d_tot, self.dt, self.rule)
+
+    def memory(self, k : int) -> tuple[np.ndarray, np.ndarray]:
+        # speeds and positions of all cars k + 1 steps ago, the same as memory[k] in the models
+        row = (self.head - 1 - k) % self.r_max
+        return self.hist_v[row], self.hist_pos[row]
+
+    def unwrapped(self) -> np.ndarray:
+        return self.pos + self.lap * self.d_tot
+
+    def rescaled(self, scale : int = None) -> "State":
+        # a copy in fixed point with the given scale, or in floats for None
+        speed, acc = (1, 1) if self.scale is None else (self.scale, self.scale // self.den)
+        state = State(self.pos / self.unit, self.v / speed, self.v_max / speed, self.r, self.a / acc, self.ret / acc,
+                      self.d_tot // self.unit, self.dt / self.den, self.rule,
+                      hist_v=[self.memory(k)[0] / speed for k in range(self.r_max)],
+                      hist_pos=[self.memory(k)[1] / self.unit for k in range(self.r_max)],
+                      counts=self.counts, lap=self.lap, scale=scale)
+        state.k = self.k
+        return state
+
+    def to_float(self) -> "State":
+        return self if self.scale is None else self.rescaled(None)
+
+def from_cars(cars : list, memory : list, d_tot : int, dt : float, rule : str = "model3") -> State:
+    # build the array state from the Car/MemCell lists that the models set up
+    return State(
+        [car.pos for car in cars],
+        [car.v for car in cars],
+        [car.v_max for car in cars],
+        [car.r for car in cars],
+        [car.a for car in cars],
+        [getattr(car, "ret", 0) for car in cars],
+        d_tot, dt, rule,
+        hist_v=[[cell.v for cell in row] for row in memory],
+        hist_pos=[[cell.pos for cell in row] for row in memory],
+    )
+
+def gap(state : State) -> np.ndarray:
+    # distance to the car in front along the ring, like (pre_car.pos - car.pos) % D_TOT in model2
+    return (np.take(state.pos, state.leader) - state.pos) % state.d_tot
+
+def move_model1(v : np.ndarray, pre_v : np.ndarray, gap : np.ndarray, state : State) -> np.ndarray:
+    # model1: brake without a floor at 0, and accelerate whenever we are below v_max
+    brake = v > pre_v
+    return np.where(brake, v - state.a * state.dt, np.where(v >= state.v_max, state.v_max, v + state.a * state.dt))
+
+def move_model3(v : np.ndarray, pre_v : np.ndarray, gap : np.ndarray, state : State) -> np.ndarray:
+    # model3/model4: brake down to at most 0, clamp at v_max, accelerate only if the car in front is faster
+    dv = state.a * state.dt
+    new_v = np.where(v < pre_v, v + dv, v)
+    new_v = np.where(v >= state.v_max, state.v_max, new_v)
+    return np.where(v > pre_v, np.maximum(v - dv, 0), new_v)
+
+def move_model2(v : np.ndarray, pre_v : np.ndarray, gap : np.ndarray, state : State) -> np.ndarray:
+    # model2: accelerate if the car in front is faster, otherwise brake just enough to match its
+    # speed before reaching it, but at least with the retardation of the car (ret < 0)
+    v = np.minimum(v, state.v_max)
+    delta_v = v - pre_v
+    room = 2*(gap - delta_v * state.r)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # no room left at all means stopping right away
+        ret = np.where(room == 0, -np.inf, np.trunc(delta_v**2 / np.where(room == 0, 1, room)))
+    ret = np.minimum(ret, state.ret)
+    new_v = np.where(v < pre_v, v + state.a * state.dt, v)
+    return np.where(v > pre_v, np.maximum(v + ret * state.dt, 0), new_v)
+
+def move_model2_fixed(v : np.ndarray, pre_v : np.ndarray, gap : np.ndarray, state : State) -> np.ndarray:
+    # move_model2 on a fixed point state, with the braking computed in integers: in the units of
+    # State, delta_v**2 / room of move_model2 is delta_v**2 * den / (scale * room)
+    dtype = v.dtype
+    v = np.minimum(v, state.v_max)
+    delta_v = v.astype(np.int64) - pre_v
+    room = 2*(gap - delta_v * state.r * state.den)
+    num, den = delta_v**2 * state.den, state.scale * room
+    # np.trunc of the quotient, in whole units of the models, then in the units of ret
+    ret = np.sign(num) * np.sign(den) * (np.abs(num) // np.maximum(np.abs(den), 1)) * (state.scale // state.den)
+    ret = np.minimum(ret, state.ret)
+    new_v = np.where(v < pre_v, v + state.a * state.dt, v)
+    braked = np.where(room == 0, 0, np.maximum(v + ret * state.dt, 0))
+    return np.where(v > pre_v, braked, new_v).astype(dtype)
+
+# Registry of the rule kernels. A kernel is a function move(v, pre_v, gap, state) -> new v of whole
+# arrays: the speeds of the cars, the speeds of the cars in front as they remember them, the
+# distances to the cars in front (None unless registered with gap=True) and the state for the per
+# car parameters (v_max, r, a, ret) and dt. A registered rule is stepped by step() and the
+# profiler, batched by ensemble.py and available to sweep.run(rule=...), flow.diagrams and
+# bench.py. fixed is a kernel for fixed point states (scale), needed unless move only adds and
+# multiplies the integer arrays of the state. free_flow tells when a car at v_max keeps v_max
+# whatever the gap, which active.ActiveSet relies on: "at_least" while the car in front (as
+# remembered) is at least as fast, "equal" only while it is exactly as fast (model2 accelerates
+# past v_max behind a faster car), None if not known, and then the ActiveSet refuses the rule.
+# Bump the version of a rule whenever a change to it changes the trajectories, cached sweep results
+# (cache.py) are keyed on it.
+RULES = {}
+RULE_VERSIONS = {}
+# rules that need the distance to the car in front
+GAP_RULES = set()
+# rules that need their own kernel on fixed point states, the others are exact in integers as they are
+FIXED_RULES = {}
+# free_flow of the rules that have one
+FREE_FLOW_RULES = {}
+# modules that registered rules, worker processes import them again with import_rules (under the
+# spawn start method a worker only has the rules of this module otherwise)
+RULE_MODULES = []
+
+def register_rule(name : str, move, version : int = 1, gap : bool = False, fixed=None, free_flow : str = None):
+    if name in RULES:
+        raise ValueError("there already is a rule %r" % name)
+    if free_flow not in (None, "at_least", "equal"):
+        raise ValueError("free_flow has to be None, \"at_least\" or \"equal\", not %r" % (free_flow,))
+    RULES[name] = move
+    RULE_VERSIONS[name] = version
+    if gap:
+        GAP_RULES.add(name)
+    if fixed is not None:
+        FIXED_RULES[name] = fixed
+    if free_flow is not None:
+        FREE_FLOW_RULES[name] = free_flow
+    module = getattr(move, "__module__", None)
+    if module not in (None, __name__, "__main__") and module not in RULE_MODULES:
+        RULE_MODULES.append(module)
+    return move
+
+def import_rules(modules : list[str]) -> None:
+    # import modules that register rules, also as the initializer of worker processes
+    for module in modules:
+        importlib.import_module(module)
+        if module not in RULE_MODULES:
+            RULE_MODULES.append(module)
+
+register_rule("model1", move_model1, free_flow="at_least")
+register_rule("model2", move_model2, gap=True, fixed=move_model2_fixed, free_flow="equal")
+register_rule("model3", move_model3, free_flow="at_least")
+register_rule("model4", move_model3, free_flow="at_least")
+
+def rule(state : State):
+    # the move function that steps state
+    if state.rule not in RULES:
+        raise KeyError("unknown rule %r, registered are %s" % (state.rule, ", ".join(RULES)))
+    if state.scale is not None and state.rule in FIXED_RULES:
+        return FIXED_RULES[state.rule]
+    return RULES[state.rule]
+
+# The phases of step(), separate so that profiling.Profiler can time them while doing exactly the same.
+
+def lookup(state : State) -> tuple[np.ndarray, np.ndarray | None]:
+    # speed of the car in front as we remember it, memory[car.r - 1][(i + 1) % N] for every car at
+    # once, and the distance to it for the rules that need it
+    idx = state._lag_idx
+    np.add(state._lag_base, state.head * state.size, out=idx)
+    np.remainder(idx, state.hist_v.size, out=idx)
+    pre_v = np.take(state.hist_v, idx, out=state._pre_v)
+    dist = gap(state) if state.rule in GAP_RULES else None
+    return pre_v, dist
+
+def remember(state : State) -> None:
+    # the oldest row is not needed anymore, overwrite it with the current state
+    state.hist_v[state.head] = state.v
+    state.hist_pos[state.head] = state.pos
+    state.head = (state.head + 1) % state.r_max
+
+def apply_rule(state : State, pre_v : np.ndarray, dist : np.ndarray | None) -> None:
+    v = rule(state)(state.v, pre_v, dist, state)
+    if v.dtype != state.v.dtype:
+        raise TypeError("rule %s gives %s speeds for a %s state, fixed point states need a fixed kernel (register_rule)" % (state.rule, v.dtype, state.v.dtype))
+    state.v = v
+
+def advance(state : State) -> None:
+    # move every car with its new speed and wrap around the ring, counting the laps
+    state.pos += state.v * state.dt
+    np.floor_divide(state.pos, state.d_tot, out=state._wraps)
+    np.add(state.lap, state._wraps, out=state.lap, casting="unsafe")
+    np.remainder(state.pos, state.d_tot, out=state.pos)
+    state.k += 1
+
+def step(state : State) -> None:
+    pre_v, dist = lookup(state)
+    remember(state)
+    apply_rule(state, pre_v, dist)
+    advance(state)
+
+def run(state : State, steps : int) -> None:
+    for _ in range(steps):
+        step(state)
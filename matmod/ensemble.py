@@ -0,0 +1,157 @@
+# Ensemble mode: many scenarios (parameter sets) are stacked into (B, n) arrays and advanced
+# together with a single engine.step, instead of one simulate() call per grid point.
+
+import numpy as np
+from . import engine
+from . import metrics
+from . import spectral
+
+# defaults of simulate_steady, see there
+STEADY_WINDOW = 50
+STEADY_TOL = 0.02
+STEADY_MIN_BLOCKS = 4
+STEADY_SIZE_TOL = 1
+
+def stack(states : list[engine.State]) -> engine.State:
+    # stack single ring states into one batched state, rings with fewer cars are padded at the end
+    first = states[0]
+    for state in states:
+        if state.d_tot != first.d_tot or state.dt != first.dt or state.rule != first.rule or state.scale != first.scale:
+            raise ValueError("can only stack states with the same d_tot, dt, rule and scale: %s vs %s" % (state, first))
+    if first.scale is not None:
+        # the conversion to floats and back is exact
+        return stack([state.to_float() for state in states]).rescaled(first.scale)
+
+    b = len(states)
+    n = max(state.n for state in states)
+    r_max = max(state.r_max for state in states)
+    pos, v, v_max, a, ret = (np.zeros((b, n)) for _ in range(5))
+    r = np.ones((b, n), dtype=np.int64)
+    lap = np.zeros((b, n), dtype=np.int64)
+    hist_v = np.zeros((r_max, b, n))
+    hist_pos = np.zeros((r_max, b, n))
+
+    for j, state in enumerate(states):
+        m = state.n
+        pos[j, :m], v[j, :m], v_max[j, :m] = state.pos, state.v, state.v_max
+        r[j, :m], a[j, :m], ret[j, :m], lap[j, :m] = state.r, state.a, state.ret, state.lap
+        # history in the order of the models' memory, rows beyond the state's own r_max are never read
+        for k in range(r_max):
+            hist_v[k, j, :m], hist_pos[k, j, :m] = state.memory(min(k, state.r_max - 1))
+
+    return engine.State(pos, v, v_max, r, a, ret, first.d_tot, first.dt, first.rule,
+                        hist_v=hist_v, hist_pos=hist_pos, counts=[state.n for state in states], lap=lap)
+
+def select(batch : engine.State, rows) -> engine.State:
+    # a batched state with only the given rings of batch, e.g. to drop the finished ones
+    if batch.scale is not None:
+        return select(batch.to_float(), rows).rescaled(batch.scale)
+    hist = [batch.memory(k) for k in range(batch.r_max)]
+    state = engine.State(batch.pos[rows], batch.v[rows], batch.v_max[rows], batch.r[rows], batch.a[rows], batch.ret[rows],
+                         batch.d_tot, batch.dt, batch.rule, hist_v=[v[rows] for v, _ in hist], hist_pos=[pos[rows] for _, pos in hist],
+                         counts=batch.counts[rows], lap=batch.lap[rows])
+    state.k = batch.k
+    return state
+
+def min_wave_pos(state : engine.State) -> np.ndarray:
+    # position of the slowest car of every ring, moved to (-d_tot/2, d_tot/2] like in model4.simulate
+    slowest = np.argmin(np.where(state.mask, state.v, np.inf), axis=-1)
+    pos = np.take_along_axis(state.pos, slowest[..., None], axis=-1)[..., 0]
+    return np.where(pos > state.d_tot/2, pos - state.d_tot, pos)
+
+def wave_size(state : engine.State) -> np.ndarray:
+    # number of cars under 95% of the max speed of their ring
+    v_max = np.max(np.where(state.mask, state.v, -np.inf), axis=-1)
+    return np.sum((state.v < 0.95 * v_max[..., None]) & state.mask, axis=-1)
+
+def simulate(states : list[engine.State], start_k : int, stop_k : int) -> tuple[list[int], list[float]]:
+    # the same wave size and wave speed as model4.simulate, for every state in the list
+    batch = stack(states)
+    for k in range(stop_k):
+        engine.step(batch)
+        if k == start_k:
+            start_pos = min_wave_pos(batch)
+        if k == stop_k - 1:
+            stop_pos = min_wave_pos(batch)
+
+    wave_speed = (start_pos - stop_pos) / (stop_k-1 - start_k) / batch.unit
+    return wave_size(batch).tolist(), wave_speed.tolist()
+
+def simulate_spectral(states : list[engine.State], start_k : int, stop_k : int, cells : int = 256, lag : int = 10) -> tuple[list[int], list[float]]:
+    # like simulate, but the wave speed comes from the cross-correlation of the speed field over
+    # steps start_k to stop_k (spectral.SpectralWaveSpeed) instead of from two positions of the
+    # slowest car, which is accurate from far shorter runs
+    batch = stack(states)
+    engine.run(batch, start_k)
+    estimator = spectral.SpectralWaveSpeed(batch, cells, lag, window=max(1, stop_k - start_k - lag))
+    for k in range(start_k, stop_k):
+        engine.step(batch)
+        speed = estimator.update(batch)
+    return wave_size(batch).tolist(), (speed * batch.dt / batch.unit).tolist()
+
+def simulate_steady(states : list[engine.State], max_k : int = 10000, window : int = STEADY_WINDOW, tol : float = STEADY_TOL,
+                    min_blocks : int = STEADY_MIN_BLOCKS, size_tol : int = STEADY_SIZE_TOL) -> tuple[list[int], list[float], list[int]]:
+    # Like simulate, but instead of a hand picked start_k/stop_k every scenario runs until its wave
+    # has settled, and finished scenarios drop out of the batch while the others continue.
+    # The steps are cut into blocks of window steps. Warm-up ends after the first block in which
+    # the wave size varies by at most size_tol. From then on the mean wave speed of every block is
+    # collected, and the scenario has converged once there are min_blocks of them and the standard
+    # error of their mean is within tol of the mean. A ring that is back to uniform free flow is
+    # finished right away, with wave size 0 and wave speed nan.
+    # Returns wave size, wave speed (in the units of simulate) and the number of steps per scenario.
+    b = len(states)
+    wave_size = np.zeros(b, dtype=np.int64)
+    wave_speed = np.full(b, np.nan)
+    steps = np.full(b, max_k)
+
+    batch = stack(states)
+    rows = np.arange(b)
+    wave = metrics.WaveMetrics(batch, window=1, history=window)
+    measuring = np.zeros(b, dtype=bool)
+    block_sum, blocks, blocks_sum, blocks_sq = np.zeros(b), np.zeros(b), np.zeros(b), np.zeros(b)
+    finished = np.zeros(b, dtype=bool)
+
+    for k in range(1, max_k + 1):
+        engine.step(batch)
+        current = wave.update(batch)
+        block_sum += np.where(measuring, current["speed"] * batch.dt, 0)
+
+        free = current["depth"] <= 0
+        converged = np.zeros(len(rows), dtype=bool)
+        if k % window == 0:
+            sizes = wave.series("size")
+            settled = sizes.max(axis=0) - sizes.min(axis=0) <= size_tol
+            block_mean = block_sum / window
+            blocks_sum += np.where(measuring, block_mean, 0)
+            blocks_sq += np.where(measuring, block_mean**2, 0)
+            blocks += measuring
+            block_sum[:] = 0
+            measuring |= settled
+
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mean = blocks_sum / blocks
+                std_err = np.sqrt(np.maximum(blocks_sq / blocks - mean**2, 0) / np.maximum(blocks - 1, 1))
+                converged = (blocks >= min_blocks) & (std_err <= tol * np.abs(mean))
+
+        done = ~finished & (free | converged | (k == max_k))
+        if done.any():
+            with np.errstate(invalid="ignore", divide="ignore"):
+                speed = blocks_sum / blocks
+            if k == max_k:
+                # not converged, use whatever has been measured, or the last block if warm-up never ended
+                speed = np.where(blocks > 0, speed, wave.series("speed").mean(axis=0) * batch.dt)
+            wave_size[rows[done]] = np.where(free, 0, current["size"])[done]
+            wave_speed[rows[done]] = np.where(free, np.nan, speed / batch.unit)[done]
+            steps[rows[done]] = k
+            finished |= done
+
+        if finished.all():
+            break
+        if finished.sum() * 4 >= len(rows):
+            keep = ~finished
+            batch = select(batch, keep)
+            wave.select(keep)
+            rows, measuring, finished = rows[keep], measuring[keep], finished[keep]
+            block_sum, blocks, blocks_sum, blocks_sq = block_sum[keep], blocks[keep], blocks_sum[keep], blocks_sq[keep]
+
+    return wave_size.tolist(), wave_speed.tolist(), steps.tolist()
@@ -0,0 +1,84 @@
+# Flow-density relationship (fundamental diagram) of the ring.
+# LoopDetectors are virtual induction loops at fixed positions of the ring. After every step the
+# cars that drove over each loop are counted for all loops and rings at once: with x a loop and
+# pos in [0, d_tot), a car crossed x (lap - lap_before) + (pos >= x) - (pos_before >= x) times,
+# negative when it drove backwards (model1 does not stop braking at 0). The time-averaged flow is
+# the number of crossings per unit time, averaged over the loops.
+#
+# diagram() runs the rings of many densities as one ensemble and measures their flow after a
+# warm-up, diagrams() does so for every rule in engine.RULES, one worker process per rule.
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from . import engine
+from . import ensemble
+
+class LoopDetectors:
+    def __init__(self, state : engine.State, loops : int = 4) -> None:
+        # loops detectors spread evenly over the ring, the same positions on every ring
+        self.x = np.arange(loops) * state.d_tot / loops
+        self.crossings = np.zeros(state.shape[:-1] + (loops,), dtype=np.int64)
+        self.steps = 0
+        self.dt = state.dt
+        self._reset(state)
+
+    def __repr__(self) -> str:
+        return "LoopDetectors(loops=%i, steps=%i)" % (len(self.x), self.steps)
+
+    def _above(self, state : engine.State) -> np.ndarray:
+        # number of real cars at or behind every loop, per ring
+        return np.sum((state.pos[..., None] >= self.x) & state.mask[..., None], axis=-2)
+
+    def _reset(self, state : engine.State) -> None:
+        self.laps = np.sum(np.where(state.mask, state.lap, 0), axis=-1)
+        self.above = self._above(state)
+
+    def update(self, state : engine.State) -> np.ndarray:
+        # count the crossings of the last step, returns them per ring and loop
+        laps = np.sum(np.where(state.mask, state.lap, 0), axis=-1)
+        above = self._above(state)
+        crossed = (laps - self.laps)[..., None] + above - self.above
+        self.crossings += crossed
+        self.laps, self.above = laps, above
+        self.steps += 1
+        return crossed
+
+    def flow(self) -> np.ndarray:
+        # crossings per unit time, averaged over the loops
+        return self.crossings.mean(axis=-1) / (self.steps * self.dt)
+
+def diagram(states : list[engine.State], warmup : int = 1000, steps : int = 2000, loops : int = 4) -> dict:
+    # density (cars per unit length), flow (cars per unit time) and mean speed of every state
+    batch = ensemble.stack(states)
+    engine.run(batch, warmup)
+    detectors = LoopDetectors(batch, loops)
+    speed = np.zeros(batch.shape[:-1])
+    for _ in range(steps):
+        engine.step(batch)
+        detectors.update(batch)
+        speed += np.sum(np.where(batch.mask, batch.v, 0), axis=-1)
+    return {
+        "n": batch.counts.tolist(),
+        "density": (batch.counts / batch.d_tot).tolist(),
+        "flow": detectors.flow().tolist(),
+        "speed": (speed / (steps * batch.counts)).tolist(),
+    }
+
+def rule_diagram(rule : str, ns : list[int], warmup : int, steps : int, loops : int, parameters : dict) -> dict:
+    # the fundamental diagram of rule on the rings of model4, one ring per number of cars in ns
+    from . import model4
+    states = []
+    for n in ns:
+        state = model4.setup_state(n=n, **parameters)
+        state.rule = rule
+        states.append(state)
+    return dict(diagram(states, warmup, steps, loops), rule=rule)
+
+def diagrams(ns : list[int], rules : list[str] = None, warmup : int = 1000, steps : int = 2000, loops : int = 4, workers : int = None, **parameters) -> dict:
+    # rule_diagram for every rule, in parallel
+    rules = list(engine.RULES) if rules is None else rules
+    with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count(), len(rules)), initializer=engine.import_rules, initargs=(list(engine.RULE_MODULES),)) as pool:
+        futures = {rule: pool.submit(rule_diagram, rule, list(ns), warmup, steps, loops, parameters) for rule in rules}
+        return {rule: future.result() for rule, future in futures.items()}
@@ -0,0 +1,179 @@
+# Helpers for the live matplotlib views of the models.
+
+import time
+
+import numpy as np
+
+class Pacer:
+    # Advances a simulation several steps per animation frame, so that the simulation speed is
+    # not tied to the frame rate of the GUI. With a fixed steps the same number of steps is taken
+    # every frame. Otherwise the number of steps adapts to the frame budget (the animation
+    # interval): it grows while the display keeps up, and when frames take longer than the budget
+    # it is cut to what is left of the budget after drawing.
+    def __init__(self, step, interval : int, steps : int = None, max_steps : int = 100_000) -> None:
+        self.step = step
+        self.budget = interval / 1000
+        self.adaptive = steps is None
+        self.steps = steps or 1
+        self.max_steps = max_steps
+        self.step_time = 0.0
+        self.last = None
+
+    def __repr__(self) -> str:
+        return "Pacer(steps=%i, adaptive=%s, budget=%gs)" % (self.steps, self.adaptive, self.budget)
+
+    def frame(self) -> int:
+        # advance the simulation for one frame, returns the number of steps taken
+        now = time.perf_counter()
+        if self.adaptive and self.last is not None and self.step_time > 0:
+            period = now - self.last
+            if period > 1.05 * self.budget:
+                # falling behind, everything but the stepping is drawing
+                per_step = self.step_time / self.steps
+                draw_time = period - self.step_time
+                self.steps = max(1, int((self.budget - draw_time) / per_step))
+            else:
+                self.steps = min(self.max_steps, int(self.steps * 1.25) + 1)
+        self.last = now
+
+        start = time.perf_counter()
+        for _ in range(self.steps):
+            self.step()
+        self.step_time = time.perf_counter() - start
+        return self.steps
+
+class RingBins:
+    # Cars binned per angular bin of the ring, for drawing rings with far more cars than pixels.
+    # Every frame the positions and speeds are read straight from the state arrays into
+    # preallocated buffers, and the mean and min speed and the number of cars of every bin are
+    # computed with a few array passes. Empty bins have nan speeds.
+    def __init__(self, state, bins : int = 1024, ring : int = 0) -> None:
+        self.bins = bins
+        self.ring = ring
+        self.n = int(state.counts) if state.counts.ndim == 0 else int(state.counts[ring])
+        self._scaled = np.empty(self.n)
+        self._idx = np.empty(self.n, dtype=np.int64)
+        self.count = np.zeros(bins)
+        self.mean = np.full(bins, np.nan)
+        self.min = np.full(bins, np.nan)
+
+    def __repr__(self) -> str:
+        return "RingBins(n=%i, bins=%i)" % (self.n, self.bins)
+
+    def update(self, state) -> bool:
+        # bin the current state, returns if anything changed since the last update
+        pos, v = state.pos, state.v
+        if pos.ndim == 2:
+            pos, v = pos[self.ring], v[self.ring]
+        pos, v = pos[:self.n], v[:self.n]
+        np.multiply(pos, self.bins / state.d_tot, out=self._scaled)
+        self._idx[...] = self._scaled
+        np.minimum(self._idx, self.bins - 1, out=self._idx)
+
+        count = np.bincount(self._idx, minlength=self.bins)
+        total = np.bincount(self._idx, weights=v, minlength=self.bins)
+
+        # the cars are in order around the ring, starting from the one closest to 0 the bins of
+        # consecutive cars only go up, unless someone has overtaken
+        start = int(np.argmin(self._idx))
+        idx, v = np.roll(self._idx, -start), np.roll(v, -start)
+        if np.any(idx[1:] < idx[:-1]):
+            order = np.argsort(idx, kind="stable")
+            idx, v = idx[order], v[order]
+        firsts = np.flatnonzero(np.diff(idx, prepend=-1))
+
+        new_min = np.full(self.bins, np.nan)
+        new_min[idx[firsts]] = np.minimum.reduceat(v, firsts)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            new_mean = np.where(count > 0, total / count, np.nan)
+        changed = not (np.array_equal(count, self.count) and np.array_equal(new_min, self.min, equal_nan=True)
+                       and np.array_equal(new_mean, self.mean, equal_nan=True))
+        self.count[...], self.min[...], self.mean[...] = count, new_min, new_mean
+        return changed
+
+def show(state, bins : int = 1024, interval : int = 40, steps : int = None, step=None) -> None:
+    # Live view for very large rings: the ring road is drawn as bins colored by the min speed of
+    # their cars and the "Speeds" view shows the mean and min speed per bin around the ring.
+    # Only the artists whose data changed are redrawn (blitting). The spacetime diagram next to
+    # them is updated every step.
+    import matplotlib.pyplot as plt
+    from matplotlib.animation import FuncAnimation
+    from . import engine
+    from .spacetime import Spacetime
+
+    ring_bins = RingBins(state, bins)
+    diagram = Spacetime(state)
+    step = step or (lambda: engine.step(state))
+
+    def step_and_record():
+        step()
+        diagram.update(state)
+
+    pacer = Pacer(step_and_record, interval, steps)
+    v_top = float(np.max(state.v_max)) + 20
+    thetas = 2*np.pi * (np.arange(bins) + 0.5) / bins
+
+    car_fig = plt.figure()
+    car_ax = plt.axes(xlim=(-1.1, 1.1), ylim=(-1.1, 1.1))
+    car_ax.set_aspect('equal')
+    car_ax.add_artist(plt.Circle((0, 0), 1, fill=False))
+    cmap = plt.get_cmap("RdYlGn").copy()
+    cmap.set_bad(alpha=0)
+    ring = car_ax.scatter(np.cos(thetas), np.sin(thetas), c=np.full(bins, np.nan), s=12, marker="s", cmap=cmap, vmin=0, vmax=v_top)
+    car_fig.colorbar(ring, ax=car_ax, label="min speed")
+
+    v_fig = plt.figure()
+    v_ax = plt.axes(xlim=(0, bins), ylim=(0, v_top))
+    v_ax.set_title("Speeds")
+    v_ax.set_xlabel("position bin")
+    mean_line, = v_ax.plot([], [], label="mean")
+    min_line, = v_ax.plot([], [], label="min")
+    v_ax.legend(loc="lower right")
+    x = np.arange(bins)
+    speeds_changed = [False]
+
+    def animate_ring(frame):
+        pacer.frame()
+        if not ring_bins.update(state):
+            return ()
+        ring.set_array(ring_bins.min)
+        mean_line.set_data(x, ring_bins.mean)
+        min_line.set_data(x, ring_bins.min)
+        speeds_changed[0] = True
+        return ring,
+
+    def animate_speeds(frame):
+        if not speeds_changed[0]:
+            return ()
+        speeds_changed[0] = False
+        return mean_line, min_line
+
+    car_anim = FuncAnimation(car_fig, animate_ring, interval=interval, blit=True, cache_frame_data=False)
+    v_anim = FuncAnimation(v_fig, animate_speeds, interval=interval, blit=True, cache_frame_data=False)
+    spacetime_fig, spacetime_anim = spacetime_view(diagram, v_top)
+    plt.show()
+
+def spacetime_view(spacetime, v_max : float, interval : int = 200):
+    # figure with the spacetime diagram of a spacetime.Spacetime that is updated elsewhere, redrawn
+    # every interval ms. Returns the figure and its animation, which has to be kept alive.
+    import matplotlib.pyplot as plt
+    from matplotlib.animation import FuncAnimation
+
+    fig = plt.figure()
+    axis = plt.axes()
+    axis.set_title("Spacetime")
+    axis.set_xlabel("position")
+    axis.set_ylabel("step")
+    cmap = plt.get_cmap("RdYlGn").copy()
+    cmap.set_bad(alpha=0)
+    image = axis.imshow(spacetime.image(), aspect="auto", origin="lower", interpolation="nearest", cmap=cmap, vmin=0, vmax=v_max)
+    fig.colorbar(image, ax=axis, label="mean speed")
+
+    def animate(frame):
+        image.set_data(spacetime.image())
+        image.set_extent(spacetime.extent())
+        axis.set_ylim(*spacetime.extent()[2:])
+        return image,
+
+    # the time axis grows, so the whole figure is redrawn (no blitting), but only a few times a second
+    return fig, FuncAnimation(fig, animate, interval=interval, cache_frame_data=False)
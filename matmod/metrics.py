@@ -0,0 +1,125 @@
+# Online wave metrics that are updated once per step in O(1) memory, for runs of any length.
+# For every ring of a state (so also per scenario of an ensemble) we keep
+#   position   - position of the slowest car, the bottom of the wave
+#   speed      - how fast the bottom of the wave moves backwards (against the traffic) per unit of
+#                time, from the slowest car now and the slowest car one step ago (state.memory(0))
+#   speed_ema  - exponential moving average of speed
+#   speed_mean - running mean of speed over the last window updates
+#   size       - number of cars under 95% of the max speed
+#   depth      - max speed minus min speed
+# The last history values of each are kept in ring buffers for plotting.
+
+import numpy as np
+
+METRICS = ("position", "speed", "speed_ema", "speed_mean", "size", "depth")
+
+class RingBuffer:
+    # fixed capacity buffer of the last values appended, each value of the given shape
+    def __init__(self, capacity : int, shape : tuple = (), dtype=float) -> None:
+        self.data = np.zeros((capacity,) + tuple(shape), dtype=dtype)
+        self.capacity = capacity
+        self.head = 0
+        self.size = 0
+
+    def __repr__(self) -> str:
+        return "RingBuffer(size=%i, capacity=%i)" % (self.size, self.capacity)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def append(self, value) -> None:
+        self.data[self.head] = value
+        self.head = (self.head + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def last(self, k : int = 0):
+        # the value appended k appends ago
+        return self.data[(self.head - 1 - k) % self.capacity]
+
+    def values(self) -> np.ndarray:
+        # the values in the order they were appended, oldest first
+        if self.size < self.capacity:
+            return self.data[:self.size]
+        return np.concatenate((self.data[self.head:], self.data[:self.head]))
+
+    def select(self, rows) -> None:
+        # keep only the given rings of values of shape (B,)
+        self.data = self.data[:, rows]
+
+class RunningMean:
+    # mean of the last window values, updated in O(1) per value
+    def __init__(self, window : int, shape : tuple = ()) -> None:
+        self.window = RingBuffer(window, shape)
+        self.sum = np.zeros(shape)
+
+    def __repr__(self) -> str:
+        return "RunningMean(window=%i)" % self.window.capacity
+
+    def append(self, value) -> np.ndarray:
+        if len(self.window) == self.window.capacity:
+            self.sum -= self.window.last(self.window.capacity - 1)
+        self.window.append(value)
+        self.sum += value
+        return self.sum / len(self.window)
+
+    def select(self, rows) -> None:
+        self.window.select(rows)
+        self.sum = self.sum[rows]
+
+class WaveMetrics:
+    def __init__(self, state, window : int = 5, alpha : float = 0.1, history : int = 1000) -> None:
+        self.shape = state.shape[:-1]
+        self.alpha = alpha
+        self.updates = 0
+        self.current = dict.fromkeys(METRICS, np.zeros(self.shape))
+        self.mean = RunningMean(window, self.shape)
+        self.history = {name: RingBuffer(history, self.shape) for name in METRICS}
+
+    def __repr__(self) -> str:
+        return "WaveMetrics(updates=%i, %s)" % (self.updates, ", ".join("%s=%s" % (name, self.current[name]) for name in METRICS))
+
+    def __getitem__(self, name : str) -> np.ndarray:
+        return self.current[name]
+
+    def update(self, state) -> dict:
+        # update the metrics from the state right after a step
+        v = np.where(state.mask, state.v, np.inf)
+        slowest = np.argmin(v, axis=-1)[..., None]
+        position = np.take_along_axis(state.pos, slowest, axis=-1)[..., 0]
+
+        mem_v, mem_pos = state.memory(0)
+        prev_slowest = np.argmin(np.where(state.mask, mem_v, np.inf), axis=-1)[..., None]
+        prev_position = np.take_along_axis(mem_pos, prev_slowest, axis=-1)[..., 0]
+        # the displacement of the bottom of the wave in (-d_tot/2, d_tot/2]
+        moved = (position - prev_position + state.d_tot/2) % state.d_tot - state.d_tot/2
+        speed = -moved / state.dt
+
+        v_min = np.take_along_axis(v, slowest, axis=-1)[..., 0]
+        v_max = np.max(np.where(state.mask, state.v, -np.inf), axis=-1)
+        size = np.sum((state.v < 0.95 * v_max[..., None]) & state.mask, axis=-1)
+
+        ema = speed if self.updates == 0 else self.alpha * speed + (1 - self.alpha) * self.current["speed_ema"]
+        self.current = {
+            "position": position,
+            "speed": speed,
+            "speed_ema": ema,
+            "speed_mean": self.mean.append(speed),
+            "size": size,
+            "depth": v_max - v_min,
+        }
+        for name in METRICS:
+            self.history[name].append(self.current[name])
+        self.updates += 1
+        return self.current
+
+    def select(self, rows) -> None:
+        # keep only the metrics of the given rings, after ensemble.select
+        self.shape = np.zeros(self.shape)[rows].shape
+        self.current = {name: value[rows] for name, value in self.current.items()}
+        self.mean.select(rows)
+        for buffer in self.history.values():
+            buffer.select(rows)
+
+    def series(self, name : str) -> np.ndarray:
+        # the last values of a metric, oldest first
+        return self.history[name].values()
@@ -1,6 +1,6 @@
-import matplotlib.pyplot as plt
-from matplotlib.animation import FuncAnimation
 import numpy as np
+from . import engine
+from . import live
 
 class Car:
     def __init__(self, v_max, reaction_time, acceleration, position) -> None:
@@ -28,6 +28,8 @@ D_TOT = 31415
 REACTION_TIME = 1
 ACCELERATION = 30
 dt = 1
+STEPS_PER_FRAME = None # None adapts the number of simulation steps per frame to the drawing time
+BINNED_VIEW_N = 5000 # rings with more cars are drawn per angular bin, see live.show
 
 def setup_cars():
     cars = [Car(V_MAX, REACTION_TIME, ACCELERATION, int(i/N*D_TOT)) for i in range(N)]
@@ -65,30 +67,42 @@ def update(cars, memory):
         move(car, memory[car.r - 1][(i + 1) % N].v, dt)
     memory = update_mem(memory, new_mem)
 
-def draw(cars, memory):
+def draw(state):
+    import matplotlib.pyplot as plt
+    from matplotlib.animation import FuncAnimation
+
     fig = plt.figure()
     axis = plt.axes(xlim=(-1.1, 1.1), ylim=(-1.1, 1.1))
     axis.set_aspect('equal')
     line, = axis.plot([], [], "rs")
+    pacer = live.Pacer(lambda: engine.step(state), 40, STEPS_PER_FRAME)
 
     def init():
-        thetas = [2*np.pi * car.pos/D_TOT for car in cars]
+        thetas = 2*np.pi * state.pos/D_TOT
         line.set_data(np.cos(thetas), np.sin(thetas))
         circle_road = plt.Circle((0, 0), 1 , fill = False)
         axis.add_artist(circle_road)
         return line,
 
     def animate(frame):
-        update(cars, memory)
-        thetas = [2*np.pi * memcell.pos/D_TOT for memcell in memory[0]]
+        pacer.frame()
+        thetas = 2*np.pi * state.memory(0)[1]/D_TOT
         line.set_data(np.cos(thetas), np.sin(thetas))
         return line,
 
     anim = FuncAnimation(fig, animate, init_func=init, interval=40, blit=True)
     plt.show()
 
-def main():
+def setup_state():
     cars, memory = setup_cars()
-    draw(cars, memory)
+    return engine.from_cars(cars, memory, D_TOT, dt, rule="model1")
+
+def main():
+    state = setup_state()
+    if N > BINNED_VIEW_N:
+        live.show(state, steps=STEPS_PER_FRAME)
+    else:
+        draw(state)
 
-main()
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
-import matplotlib.pyplot as plt
-from matplotlib.animation import FuncAnimation
 import numpy as np
+from . import collisions
+from . import engine
+from . import live
+from . import spacetime
 from functools import partial
 
 class Car:
@@ -37,6 +39,8 @@ REACTION_TIME = 4
 ACCELERATION = 50
 RETARDATION = -70
 DT = 0.1
+NEAR_MISS_GAP = 100 # gaps below this are logged as near misses, see collisions.py
+STEPS_PER_FRAME = None # None adapts the number of simulation steps per frame to the drawing time
 
 def setup_cars() -> tuple[list[Car], Memory]:
     cars = [Car(i, V_MAX, REACTION_TIME, ACCELERATION, RETARDATION, int(i/N*D_TOT)) for i in range(N)]
@@ -59,9 +63,7 @@ def update_mem(mem : Memory, new_mem_row : list[MemCell]) -> Memory:
 
 def move(car : Car, pre_mem : MemCell, pre_car : Car, dt : int) -> None:
     # print(car.v)
-    if -10000 < (pre_car.pos - car.pos) < 0:
-        print("CRASH!!!")
-        print(car, pre_car)
+    # crashes are detected for all cars at once by collisions.CollisionLog
     if car.v > car.v_max:
         car.v = car.v_max
 
@@ -101,7 +103,21 @@ def update(cars : list[Car], memory : Memory) -> None:
     # print("NEW TIME STEP")
     memory = update_mem(memory, new_mem)
 
-def draw(cars : list[Car], memory : Memory) -> None:
+def draw(state : engine.State) -> None:
+    import matplotlib.pyplot as plt
+    from matplotlib.animation import FuncAnimation
+
+    crashes = collisions.CollisionLog(state, near_gap=NEAR_MISS_GAP)
+
+    diagram = spacetime.Spacetime(state)
+
+    def step():
+        engine.step(state)
+        crashes.check(state)
+        diagram.update(state)
+
+    pacer = live.Pacer(step, 40, STEPS_PER_FRAME)
+
     def make_car_figure():
         fig = plt.figure()
         axis = plt.axes(xlim=(-1.1, 1.1), ylim=(-1.1, 1.1))
@@ -110,19 +126,16 @@ def draw(cars : list[Car], memory : Memory) -> None:
         return fig, axis, line
 
     def init_cars(axis, line):
-        thetas = [2*np.pi * car.pos/D_TOT for car in cars]
+        thetas = 2*np.pi * state.pos/D_TOT
         line.set_data(np.cos(thetas), np.sin(thetas))
         circle_road = plt.Circle((0, 0), 1 , fill = False)
         axis.add_artist(circle_road)
         return line,
 
     def animate_cars(frame, line):
-        update(cars, memory)
-        # thetas = [2*np.pi * memcell.pos/D_TOT for memcell in memory[0]]
-        thetas = [2*np.pi * car.pos/D_TOT for car in cars]
-        min_v_car = min(cars, key=lambda c: c.v)
-        prev_min_v_mem = min(memory[0], key=lambda m: m.v)
-        wave_v_approx = ((min_v_car.pos - prev_min_v_mem.pos) % D_TOT) / DT
+        pacer.frame()
+        # thetas = 2*np.pi * state.memory(0)[1]/D_TOT
+        thetas = 2*np.pi * state.pos/D_TOT
         line.set_data(np.cos(thetas), np.sin(thetas))
         return line,
 
@@ -134,7 +147,7 @@ def draw(cars : list[Car], memory : Memory) -> None:
         return fig, axis, line
 
     def animate_speeds(frame, line):
-        line.set_data(range(len(cars)), [(car.v + memcell.v)/2 for car, memcell in list(zip(cars, memory[0]))])
+        line.set_data(range(state.n), (state.v + state.memory(0)[0])/2)
         return line,
 
     car_fig, car_ax, car_line = make_car_figure()
@@ -144,12 +157,18 @@ def draw(cars : list[Car], memory : Memory) -> None:
     car_anim = FuncAnimation(car_fig, partial(animate_cars, line=car_line), init_func=partial(init_cars, axis=car_ax, line=car_line), interval=40, blit=True)
     # pos_anim = FuncAnimation(pos_fig, partial(animate_pos, line=pos_line), interval=40, blit=True)
     v_anim = FuncAnimation(v_fig, partial(animate_speeds, line=v_line), interval=20, blit=True)
+    spacetime_fig, spacetime_anim = live.spacetime_view(diagram, V_MAX + 20)
     # wave_v_anim = FuncAnimation(wave_fig, partial(animate_wave_speed, line=wave_line), interval=20, blit=True)
     plt.show()
-    print([car.v for car in cars])
+    print(state.v.tolist())
+    print(crashes.summary())
 
-def main() -> None:
+def setup_state() -> engine.State:
     cars, memory = setup_cars()
-    draw(cars, memory)
+    return engine.from_cars(cars, memory, D_TOT, DT, rule="model2")
+
+def main() -> None:
+    draw(setup_state())
 
-main()
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,9 @@
-import matplotlib.pyplot as plt
-from matplotlib.animation import FuncAnimation
 import numpy as np
+from . import engine
+from . import live
+from . import spacetime
+from . import metrics
+from . import profiling
 from functools import partial
 
 class Car:
@@ -35,23 +38,31 @@ REACTION_TIME = 4 * K
 ACCELERATION = 50 * K
 RETARDATION = -70 * K
 DT = 0.1
-WAVE_SPEED = []
-
-def dev(avg : int, key : str) -> int:
+STEPS_PER_FRAME = None # None adapts the number of simulation steps per frame to the drawing time
+BINNED_VIEW_N = 5000 # rings with more cars are drawn per angular bin, see live.show
+HETEROGENEOUS = False # draw v_max, r, a and ret of every car with dev()
+SEED = None # seed of the heterogeneous fleet, None for a different one every run
+PROFILE_PATH = None # e.g. "model3_trace.json" to time the phases of every step and frame, see profiling.py
+
+def dev(avg : int, key : str, rng : np.random.Generator, n : int) -> np.ndarray:
+    # the parameter key of n cars around avg, one vectorized draw instead of one call per car
     match key:
         case "v":
-            return round(avg + np.random.gamma(10, 1) - 5)
+            return np.round(avg + rng.gamma(10, 1, n) - 5)
         case "r":
-            return np.random.randint(avg, avg + 3)
+            return rng.integers(avg, avg + 3, n)
         case "a":
-            return np.random.randint(avg - 5, avg + 5)
+            return rng.integers(avg - 5, avg + 5, n)
         case "ret":
-            return np.random.randint(avg - 5, avg + 5)
-
+            return rng.integers(avg - 5, avg + 5, n)
 
 def setup_cars() -> tuple[list[Car], Memory]:
-    # cars = [Car(i, dev(V_MAX, "v"), dev(REACTION_TIME, "r"), dev(ACCELERATION, "a"), dev(RETARDATION, "ret"), int(i/N*D_TOT), int(0.81 * V_MAX)) for i in range(N)]
-    cars = [Car(i, V_MAX, REACTION_TIME, ACCELERATION, RETARDATION, int(i/N*D_TOT), int(1 * V_MAX)) for i in range(N)]
+    if HETEROGENEOUS:
+        rng = np.random.default_rng(SEED)
+        parameters = zip(*(dev(avg, key, rng, N).tolist() for avg, key in ((V_MAX, "v"), (REACTION_TIME, "r"), (ACCELERATION, "a"), (RETARDATION, "ret"))))
+        cars = [Car(i, v, r, a, ret, int(i/N*D_TOT), int(0.81 * V_MAX)) for i, (v, r, a, ret) in enumerate(parameters)]
+    else:
+        cars = [Car(i, V_MAX, REACTION_TIME, ACCELERATION, RETARDATION, int(i/N*D_TOT), int(1 * V_MAX)) for i in range(N)]
     r_max = max(cars, key=lambda c: c.r).r
     memory = []
 
@@ -89,7 +100,24 @@ def update(cars : list[Car], memory : Memory) -> None:
         move(car, memory[car.r - 1][(i + 1) % N], cars[(i + 1) % N], DT)
     update_mem(memory, new_mem)
 
-def draw(cars : list[Car], memory : Memory) -> None:
+def draw(state : engine.State) -> None:
+    import matplotlib.pyplot as plt
+    from matplotlib.animation import FuncAnimation
+
+    wave = metrics.WaveMetrics(state, window=5, history=N)
+    profiler = profiling.Profiler() if PROFILE_PATH else None
+    step_state = profiler.step if profiler else engine.step
+    update_wave = profiler.wrap(wave.update, "metrics") if profiler else wave.update
+    diagram = spacetime.Spacetime(state)
+    update_diagram = profiler.wrap(diagram.update, "metrics") if profiler else diagram.update
+
+    def step():
+        step_state(state)
+        update_wave(state)
+        update_diagram(state)
+
+    pacer = live.Pacer(step, 40, STEPS_PER_FRAME)
+
     def make_car_figure():
         fig = plt.figure()
         axis = plt.axes(xlim=(-1.1, 1.1), ylim=(-1.1, 1.1))
@@ -98,24 +126,24 @@ def draw(cars : list[Car], memory : Memory) -> None:
         return fig, axis, line
 
     def init_cars(axis, line):
-        thetas = [2*np.pi * car.pos/D_TOT for car in cars]
+        thetas = 2*np.pi * state.pos/D_TOT
         line.set_data(np.cos(thetas), np.sin(thetas))
         circle_road = plt.Circle((0, 0), 1 , fill = False)
         axis.add_artist(circle_road)
         return line,
 
-    def animate_cars(frame, line):
-        update(cars, memory)
-        # thetas = [2*np.pi * memcell.pos/D_TOT for memcell in memory[0]]
-        thetas = [2*np.pi * car.pos/D_TOT for car in cars]
-        min_v_car = min(cars, key=lambda c: c.v)
-        prev_min_v_mem = min(memory[0], key=lambda m: m.v)
-        wave_v_approx = ((min_v_car.pos - prev_min_v_mem.pos) % D_TOT) / DT
-        WAVE_SPEED.append(wave_v_approx)
-        # print(sum(WAVE_SPEED)/len(WAVE_SPEED))
+    def draw_cars(line):
+        # thetas = 2*np.pi * state.memory(0)[1]/D_TOT
+        thetas = 2*np.pi * state.pos/D_TOT
+        # print(wave["speed_ema"])
         line.set_data(np.cos(thetas), np.sin(thetas))
         return line,
 
+    def animate_cars(frame, line):
+        # the steps of the frame are timed by the profiler as they run, only the drawing is render
+        pacer.frame()
+        return draw_cars(line)
+
     def make_figure(title, y_max):
         fig = plt.figure()
         axis = plt.axes(xlim=(0, N), ylim=(0, y_max))
@@ -131,46 +159,49 @@ def draw(cars : list[Car], memory : Memory) -> None:
         return fig, axis, line
 
     def animate_pos(frame, line):
-        diffs = np.append(np.diff([car.pos for car in cars]), cars[0].pos - cars[N-1].pos)
-        mod_diffs = [max(d, 0) % D_TOT for d in diffs]
+        diffs = np.append(np.diff(state.pos), state.pos[0] - state.pos[-1])
+        mod_diffs = np.maximum(diffs, 0) % D_TOT
         print(mod_diffs)
-        line.set_data(range(len(cars)), mod_diffs)
+        line.set_data(range(state.n), mod_diffs)
         return line,
 
     def animate_speeds(frame, line):
-        line.set_data(range(len(cars)), [(car.v + memcell.v)/2 for car, memcell in list(zip(cars, memory[0]))])
+        line.set_data(range(state.n), (state.v + state.memory(0)[0])/2)
         return line,
 
-    def moving_average(a, n=5):
-        ret = np.cumsum(a, dtype=float)
-        ret[n:] = ret[n:] - ret[:-n]
-        return ret[n - 1:] / n
-
     def animate_wave_speed(frame, line):
-        if len(WAVE_SPEED) > N:
-            avg_speed = moving_average(WAVE_SPEED[-N:], n=5)
-            line.set_data(range(N-4), avg_speed)
-        elif len(WAVE_SPEED) > 9:
-            avg_speed = moving_average(WAVE_SPEED[-len(WAVE_SPEED):], n=min(len(WAVE_SPEED), 5))
-            line.set_data(range((min(N, len(WAVE_SPEED) - 4))), avg_speed)
-        else:
-            avg_speed = WAVE_SPEED[-min(N, len(WAVE_SPEED)):]
-            line.set_data(range((min(N, len(WAVE_SPEED)))), avg_speed)
+        avg_speed = wave.series("speed_mean")
+        line.set_data(range(len(avg_speed)), avg_speed)
         return line,
 
     car_fig, car_ax, car_line = make_car_figure()
     # pos_fig, pos_ax, pos_line = make_figure("Difference in positions", D_TOT)
     v_fig, v_ax, v_line = make_figure("Speeds", V_MAX + 20)
     # wave_fig, wave_ax, wave_line = make_figure("Wave speed", V_MAX + 200)
+    if profiler:
+        draw_cars = profiler.wrap(draw_cars, "render")
+        animate_speeds = profiler.wrap(animate_speeds, "render")
     car_anim = FuncAnimation(car_fig, partial(animate_cars, line=car_line), init_func=partial(init_cars, axis=car_ax, line=car_line), interval=40, blit=True)
     # pos_anim = FuncAnimation(pos_fig, partial(animate_pos, line=pos_line), interval=40, blit=True)
     v_anim = FuncAnimation(v_fig, partial(animate_speeds, line=v_line), interval=20, blit=True)
+    spacetime_fig, spacetime_anim = live.spacetime_view(diagram, V_MAX + 20)
     # wave_v_anim = FuncAnimation(wave_fig, partial(animate_wave_speed, line=wave_line), interval=20, blit=True)
     plt.show()
-    print([car.v for car in cars])
+    print(state.v.tolist())
+    if profiler:
+        profiler.save_trace(PROFILE_PATH)
+        print(profiler.summary())
 
-def main() -> None:
+def setup_state() -> engine.State:
     cars, memory = setup_cars()
-    draw(cars, memory)
+    return engine.from_cars(cars, memory, D_TOT, DT, rule="model3")
 
-main()
+def main() -> None:
+    state = setup_state()
+    if N > BINNED_VIEW_N:
+        live.show(state, steps=STEPS_PER_FRAME)
+    else:
+        draw(state)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+# The goal is to create plots for reaction time vs wave size, reaction time vs wave speed etc.
+# During this we shouldn't do the regular plots, as to be able to simulate for multiple reaction times etc.
+
+import numpy as np
+from . import engine
+from . import cache
+from . import ensemble
+from . import flow
+from . import stability
+from . import sweep
+
+class Car:
+    def __init__(self, id : int, v_max : int, reaction_time : int, acceleration : int, retardation : int, position : int, v : int) -> None:
+        self.id = id
+        self.v_max  = v_max
+        self.r = reaction_time
+        self.a = acceleration
+        self.ret = retardation
+        self.pos = position
+        self.v = v
+        self.pre_car = None
+
+    def __repr__(self) -> str:
+        return "Car(id=%i, v=%i, r=%i, a=%i, ret=%i, pos=%i, v_max=%i)" % (self.id, self.v, self.r, self.a, self.ret, self.pos, self.v_max)
+
+class MemCell:
+    def __init__(self, v : int, pos : int) -> None:
+        self.v = v
+        self.pos = pos
+
+    def __repr__(self) -> str:
+        return "MemCell(v=%i, pos=%i)" % (self.v, self.pos)
+
+Memory = list[list[MemCell]]
+
+N = 50
+V_MAX = 400
+D_TOT = 30000
+REACTION_TIME = 4
+ACCELERATION = 50
+RETARDATION = -50
+DT = 0.1
+CACHE_PATH = "sweep_cache.sqlite"
+# bump whenever a change to the set up changes the initial rings, cached sweep results are keyed on it
+SETUP_VERSION = 2
+
+def dev(avg : int, key : str, rng : np.random.Generator, n : int) -> np.ndarray:
+    # the parameter key of n cars around avg, one vectorized draw instead of one call per car
+    match key:
+        case "v":
+            return np.round(avg + rng.gamma(10, 1, n) - 5)
+        case "r":
+            return rng.integers(1, avg + 1, n)
+        case "a":
+            return rng.integers(avg - 5, avg + 5, n)
+        case "ret":
+            return rng.integers(avg - 5, avg + 5, n)
+
+def car_parameters(v_max : int, reaction_time : int, acceleration : int, retardation : int, n : int, heterogeneous : bool, rng : np.random.Generator) -> tuple[np.ndarray, ...]:
+    # v_max, reaction time, acceleration and retardation of every car, drawn with dev() for a heterogeneous fleet
+    if heterogeneous:
+        rng = np.random.default_rng() if rng is None else rng
+        return dev(v_max, "v", rng, n), dev(reaction_time, "r", rng, n), dev(acceleration, "a", rng, n), dev(retardation, "ret", rng, n)
+    return tuple(np.full(n, value) for value in (v_max, reaction_time, acceleration, retardation))
+
+def setup_cars_set_parameters(v_max=V_MAX, reaction_time=REACTION_TIME, acceleration=ACCELERATION, retardation=RETARDATION, n=N, heterogeneous=False, rng=None) -> tuple[list[Car], Memory]:
+    # rng is the np.random.Generator a heterogeneous fleet is drawn from, fresh entropy if None
+    parameters = car_parameters(v_max, reaction_time, acceleration, retardation, n, heterogeneous, rng)
+    cars = [Car(i, v, r, a, ret, int(i/n*D_TOT), v) for i, (v, r, a, ret) in enumerate(zip(*(p.tolist() for p in parameters)))]
+    r_max = max(cars, key=lambda c: c.r).r
+    memory = []
+
+    for i in range(r_max):
+        time_instance = []
+        for car in cars:
+            time_instance.append(MemCell(car.v, car.pos))
+        memory.append(time_instance)
+
+    cars[min(7, n - 1)].v /= 2
+    return cars, memory
+
+def setup_state(v_max=V_MAX, reaction_time=REACTION_TIME, acceleration=ACCELERATION, retardation=RETARDATION, n=N, heterogeneous=False, rng=None, scale=None) -> engine.State:
+    # the ring of setup_cars_set_parameters, built straight as arrays without Car and MemCell objects,
+    # in fixed point with the given scale if there is one (see engine.State)
+    v_max, r, a, ret = car_parameters(v_max, reaction_time, acceleration, retardation, n, heterogeneous, rng)
+    pos = (np.arange(n) / n * D_TOT).astype(np.int64)
+    v = v_max.astype(float)
+    hist_v, hist_pos = [v.copy()] * int(r.max()), [pos] * int(r.max())
+    v[min(7, n - 1)] /= 2
+    return engine.State(pos, v, v_max, r, a, ret, D_TOT, DT, "model4", hist_v=hist_v, hist_pos=hist_pos, scale=scale)
+
+def setup_states(count : int, seed : int = None, **parameters) -> list[engine.State]:
+    # count random fleets for a Monte Carlo ensemble, each drawn from its own stream spawned from seed
+    children = np.random.SeedSequence(seed).spawn(count)
+    return [setup_state(heterogeneous=True, rng=np.random.default_rng(child), **parameters) for child in children]
+
+def update_mem(mem : Memory, new_mem_row : list[MemCell]) -> Memory:
+    mem.pop()
+    mem.insert(0, new_mem_row)
+
+def move(car : Car, pre_mem : MemCell, dt : int) -> None:
+    if car.v > pre_mem.v:
+        car.v = max(car.v - car.a * dt, 0)
+    elif car.v >= car.v_max:
+        car.v = car.v_max
+    elif car.v < pre_mem.v:
+        car.v += car.a * dt
+    car.pos = (car.pos + car.v * dt) % D_TOT
+
+def update(cars : list[Car], memory : Memory, n=N) -> None:
+    new_mem = []
+    for i, car in enumerate(cars):
+        new_mem.append(MemCell(car.v, car.pos))
+        move(car, memory[car.r - 1][(i + 1) % n], DT)
+    update_mem(memory, new_mem)
+
+def simulate(cars : list[Car], memory : Memory, wave_size: list[int], wave_speed: list[int], start_k : int, stop_k : int, num_cars=N):
+    # find wave size, wave speed and wave depth for each reaction time and iteration
+
+    # wave size is seen to be the number of cars that are slowed down because of the queue
+    # meaning that wave_size = number of cars that consequtively are under the avg speed.
+    # Look at the number of cars under 95% of the max speed
+
+    # wave speed is approximated by the "speed" of the lowest speed point. This is the average
+    # distance moved by the lowest point.
+
+    # wave depth is the depth of the speed dip, roughly approximated by the difference in speed
+    # between the slowest and fastest car.
+    # only the positions of the wave at start_k and stop_k are needed, see ensemble.simulate
+    # (metrics.WaveMetrics follows the wave step by step)
+    size, speed = ensemble.simulate([engine.from_cars(cars, memory, D_TOT, DT, rule="model4")], start_k, stop_k)
+    wave_size += size
+    wave_speed += speed
+
+def reaction_speed_graphs():
+    import matplotlib.pyplot as plt
+    max_reaction_speed = 10
+    wave_size, wave_speed = sweep.run({"reaction_time": range(2, max_reaction_speed)}, 30, 100, cache=cache.Cache(CACHE_PATH))
+    plt.figure(1)
+    plt.plot(range(2, max_reaction_speed), wave_size)
+    plt.title("wave size")
+    plt.xlabel("reaction time")
+    plt.ylabel("number of cars in wave")
+
+    plt.figure(2)
+    plt.plot(range(2, max_reaction_speed), wave_speed)
+    plt.title("wave speed")
+    plt.xlabel("reaction time")
+    plt.ylabel("wave speed of shock wave")
+
+    plt.show()
+
+def num_cars_graphs():
+    import matplotlib.pyplot as plt
+    max_num_cars = 101
+    wave_size, wave_speed = sweep.run({"n": range(10, max_num_cars, 10)}, 20, 50, cache=cache.Cache(CACHE_PATH))
+    plt.figure(1)
+    plt.plot(range(10, max_num_cars, 10), wave_size)
+    plt.title("wave size")
+    plt.xlabel("number of cars")
+    plt.ylabel("number of cars in wave")
+
+    plt.figure(2)
+    plt.plot(range(10, max_num_cars, 10), wave_speed)
+    plt.title("wave speed")
+    plt.xlabel("number of cars")
+    plt.ylabel("wave speed of shock wave")
+
+    plt.show()
+
+def acc_retard_graphs():
+    import matplotlib.pyplot as plt
+    min_acc = 20
+    max_acc = 81
+    accs = [(acc, -acc) for acc in range(min_acc, max_acc, 10)]
+    wave_size, wave_speed = sweep.run({("acceleration", "retardation"): accs}, 60, 100, cache=cache.Cache(CACHE_PATH))
+    plt.figure(1)
+    plt.plot(range(min_acc, max_acc, 10), wave_size)
+    plt.title("wave size")
+    plt.xlabel("acceleration/retardation")
+    plt.ylabel("number of cars in wave")
+
+    plt.figure(2)
+    plt.plot(range(min_acc, max_acc, 10), wave_speed)
+    plt.title("wave speed")
+    plt.xlabel("acceleration/retardation")
+    plt.ylabel("wave speed of shock wave")
+
+    plt.show()
+
+def max_speed_graphs():
+    import matplotlib.pyplot as plt
+    min_max_speed = 200
+    max_max_speed = 1200
+    wave_size, wave_speed = sweep.run({"v_max": range(min_max_speed, max_max_speed, 100)}, 60, 140, cache=cache.Cache(CACHE_PATH))
+    plt.figure(1)
+    plt.plot(range(min_max_speed, max_max_speed, 100), wave_size)
+    plt.title("wave size")
+    plt.xlabel("max speed")
+    plt.ylabel("number of cars in wave")
+
+    plt.figure(2)
+    plt.plot(range(min_max_speed, max_max_speed, 100), wave_speed)
+    plt.title("wave speed")
+    plt.xlabel("max speed")
+    plt.ylabel("wave speed of shock wave")
+
+    plt.show()
+
+def critical_speed_graphs():
+    import matplotlib.pyplot as plt
+    reaction_times = range(1, 11)
+    # bisection per reaction time instead of a dense grid over v_max, see stability.py
+    critical_v_max, _ = stability.critical("v_max", 200, 1500, over={"reaction_time": reaction_times}, min_size=10, cache=cache.Cache(CACHE_PATH))
+    plt.figure(1)
+    plt.plot(reaction_times, critical_v_max)
+    plt.title("critical max speed")
+    plt.xlabel("reaction time")
+    plt.ylabel("max speed where the wave has 10 cars")
+
+    plt.show()
+
+def fundamental_diagram_graphs():
+    import matplotlib.pyplot as plt
+    diagrams = flow.diagrams(range(10, 401, 5))
+    plt.figure(1)
+    for rule, diagram in diagrams.items():
+        plt.plot(diagram["density"], diagram["flow"], label=rule)
+    plt.title("fundamental diagram")
+    plt.xlabel("density (cars per unit length)")
+    plt.ylabel("flow (cars per unit time)")
+    plt.legend()
+
+    plt.show()
+
+if __name__ == "__main__":
+    reaction_speed_graphs()
+    num_cars_graphs()
+    acc_retard_graphs()
+    max_speed_graphs()
+    critical_speed_graphs()
+    fundamental_diagram_graphs()
@@ -0,0 +1,103 @@
+# Optional per-phase profiling of the simulation.
+# Profiler.step runs the phases of engine.step one by one, times them (leader lookup, history
+# write, rule evaluation, position wrap) and counts the outcome of the rule for every car
+# (accelerate, brake, clamp at v_max or hold). Phases outside of the step, like metric extraction
+# and rendering, are timed by wrapping the functions that do them with Profiler.wrap. Profiling is
+# switched on by stepping with profiler.step instead of engine.step, so it costs nothing when off.
+#
+# summary() gives the totals of the run, save_trace() writes the phases as a Chrome trace
+# (chrome://tracing, Perfetto, speedscope) with one event per phase per step.
+
+import json
+import os
+import time
+
+import numpy as np
+from . import engine
+
+PHASES = ("leader", "history", "rule", "wrap", "metrics", "render")
+BRANCHES = ("accelerate", "brake", "clamp", "hold")
+
+class Profiler:
+    def __init__(self, trace : bool = True, max_events : int = 1_000_000) -> None:
+        self.trace = trace
+        self.max_events = max_events
+        self.events = []
+        self.time = dict.fromkeys(PHASES, 0.0)
+        self.calls = dict.fromkeys(PHASES, 0)
+        self.branches = dict.fromkeys(BRANCHES, 0)
+        self.cars = 0
+        self.steps = 0
+        self.start = time.perf_counter()
+
+    def __repr__(self) -> str:
+        return "Profiler(steps=%i, events=%i)" % (self.steps, len(self.events))
+
+    def _record(self, phase : str, start : float, stop : float) -> None:
+        self.time[phase] = self.time.get(phase, 0.0) + stop - start
+        self.calls[phase] = self.calls.get(phase, 0) + 1
+        if self.trace and len(self.events) < self.max_events:
+            self.events.append((phase, start, stop))
+
+    def step(self, state : engine.State) -> None:
+        # engine.step, phase by phase, with timing and branch counting
+        clock = time.perf_counter
+        t0 = clock()
+        pre_v, dist = engine.lookup(state)
+        t1 = clock()
+        self._record("leader", t0, t1)
+
+        engine.remember(state)
+        t2 = clock()
+        self._record("history", t1, t2)
+
+        old_v = state.v
+        engine.apply_rule(state, pre_v, dist)
+        t3 = clock()
+        self._record("rule", t2, t3)
+
+        engine.advance(state)
+        t4 = clock()
+        self._record("wrap", t3, t4)
+
+        self.count_branches(state, old_v)
+        self.steps += 1
+
+    def count_branches(self, state : engine.State, old_v : np.ndarray) -> None:
+        # what the rule did to every real car, judged from the old and new speeds
+        brake = state.v < old_v
+        clamp = ~brake & (old_v >= state.v_max)
+        accelerate = ~clamp & (state.v > old_v)
+        counts = [np.count_nonzero(accelerate & state.mask), np.count_nonzero(brake & state.mask), np.count_nonzero(clamp & state.mask)]
+        cars = int(state.counts.sum())
+        for branch, count in zip(BRANCHES, counts + [cars - sum(counts)]):
+            self.branches[branch] += int(count)
+        self.cars += cars
+
+    def wrap(self, function, phase : str):
+        # function, timed as phase every time it is called
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            result = function(*args, **kwargs)
+            self._record(phase, start, time.perf_counter())
+            return result
+        return timed
+
+    def summary(self) -> dict:
+        total = time.perf_counter() - self.start
+        phases = {
+            phase: {"total_s": self.time[phase], "calls": self.calls[phase],
+                    "mean_us": 1e6 * self.time[phase] / self.calls[phase] if self.calls[phase] else 0.0,
+                    "fraction": self.time[phase] / total if total > 0 else 0.0}
+            for phase in self.time
+        }
+        branches = {branch: count / self.cars if self.cars else 0.0 for branch, count in self.branches.items()}
+        return {"steps": self.steps, "wall_s": total, "phases": phases, "branches": dict(self.branches), "branch_fractions": branches,
+                "active_fraction": branches["accelerate"] + branches["brake"]}
+
+    def save_trace(self, path : str) -> None:
+        # Chrome trace event format, complete ("X") events with times in microseconds
+        events = [{"name": phase, "cat": "step" if phase in PHASES[:4] else phase, "ph": "X", "pid": os.getpid(), "tid": 0,
+                   "ts": 1e6 * (start - self.start), "dur": 1e6 * (stop - start)} for phase, start, stop in self.events]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms", "otherData": self.summary()}, f)
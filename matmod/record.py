@@ -0,0 +1,77 @@
+# Headless trajectory recording.
+# Positions and speeds are streamed to a .npy file of shape (frames, 2, *state.shape), where
+# [:, 0] are the positions and [:, 1] the speeds. The file is written through a memory map one
+# chunk of frames at a time, so a run only keeps a single chunk in RAM however long it is, and it
+# can be opened zero-copy afterwards with load(). The parameters of the run are written next to it
+# in <path>.json.
+
+import json
+
+import numpy as np
+from . import engine
+
+CHUNK_BYTES = 64 << 20
+
+class Recorder:
+    def __init__(self, path : str, state : engine.State, frames : int, every : int = 1, dtype=np.float64, chunk_frames : int = None) -> None:
+        self.path = path
+        self.frames = frames
+        self.every = every
+        self.dtype = np.dtype(dtype)
+        frame_shape = (2,) + state.shape
+        if chunk_frames is None:
+            chunk_frames = max(1, CHUNK_BYTES // (2 * state.size * self.dtype.itemsize))
+        self.out = np.lib.format.open_memmap(path, mode="w+", dtype=self.dtype, shape=(frames,) + frame_shape)
+        self.buffer = np.empty((min(chunk_frames, frames),) + frame_shape, dtype=self.dtype)
+        self.buffered = 0
+        self.written = 0
+
+        with open(path + ".json", "w") as f:
+            json.dump({
+                "d_tot": state.d_tot,
+                "dt": state.dt,
+                "rule": state.rule,
+                "every": every,
+                "start_k": state.k,
+                "counts": state.counts.tolist(),
+                "v_max": float(state.v_max.max()),
+            }, f)
+
+    def __repr__(self) -> str:
+        return "Recorder(path=%s, frames=%i/%i, every=%i, dtype=%s)" % (self.path, self.written + self.buffered, self.frames, self.every, self.dtype)
+
+    def add(self, state : engine.State) -> None:
+        # record the current state as the next frame
+        if self.written + self.buffered >= self.frames:
+            raise ValueError("recording %s is already full" % self.path)
+        self.buffer[self.buffered, 0] = state.pos
+        self.buffer[self.buffered, 1] = state.v
+        self.buffered += 1
+        if self.buffered == len(self.buffer):
+            self.flush()
+
+    def flush(self) -> None:
+        self.out[self.written:self.written + self.buffered] = self.buffer[:self.buffered]
+        self.out.flush()
+        self.written += self.buffered
+        self.buffered = 0
+
+    def close(self) -> None:
+        self.flush()
+        del self.out
+
+def record(state : engine.State, steps : int, path : str, every : int = 1, dtype=np.float64, chunk_frames : int = None) -> None:
+    # run the state for steps steps and record the initial state and every every-th step after it
+    recorder = Recorder(path, state, steps // every + 1, every, dtype, chunk_frames)
+    recorder.add(state)
+    for k in range(1, steps + 1):
+        engine.step(state)
+        if k % every == 0:
+            recorder.add(state)
+    recorder.close()
+
+def load(path : str) -> tuple[np.ndarray, dict]:
+    # the recorded frames as a read only memory map, and the parameters of the run
+    with open(path + ".json") as f:
+        meta = json.load(f)
+    return np.load(path, mmap_mode="r"), meta
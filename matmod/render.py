@@ -0,0 +1,90 @@
+# Offline rendering of recorded runs (see record.py) without opening a window.
+# Every frame shows the ring road like make_car_figure/init_cars in the models next to the
+# "Speeds" view of animate_speeds. The frames are cut into contiguous slices that are rendered in
+# parallel by worker processes, each drawing on its own Agg figure, and written as numbered PNGs.
+# render_video() additionally joins them into a video with ffmpeg.
+
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from . import record
+
+FRAME_NAME = "frame_%06d.png"
+
+def frame_data(frames : np.ndarray, meta : dict, i : int, ring : int = 0) -> tuple[np.ndarray, np.ndarray]:
+    # positions and speeds of the real cars of one ring in frame i
+    pos, v = frames[i, 0], frames[i, 1]
+    n = meta["counts"]
+    if pos.ndim == 2:
+        pos, v, n = pos[ring], v[ring], n[ring]
+    return pos[:n], v[:n]
+
+def render_slice(path : str, out_dir : str, indices : list[int], ring : int = 0, dpi : int = 100) -> int:
+    # no pyplot here, so no GUI backend is ever started in the workers
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    from matplotlib.patches import Circle
+    from PIL import Image
+
+    frames, meta = record.load(path)
+    n = meta["counts"][ring] if isinstance(meta["counts"], list) else meta["counts"]
+
+    fig = Figure(figsize=(10, 5), dpi=dpi)
+    canvas = FigureCanvasAgg(fig)
+    car_ax, v_ax = fig.subplots(1, 2)
+    car_ax.set_xlim(-1.1, 1.1)
+    car_ax.set_ylim(-1.1, 1.1)
+    car_ax.set_aspect('equal')
+    car_ax.add_artist(Circle((0, 0), 1, fill=False))
+    car_line, = car_ax.plot([], [], "rs", animated=True)
+    v_ax.set_xlim(0, n)
+    v_ax.set_ylim(0, meta["v_max"] + 20)
+    v_ax.set_title("Speeds")
+    v_line, = v_ax.plot([], [], animated=True)
+    title = fig.suptitle("", animated=True)
+
+    # the axes never change, draw them once and only blit the lines and the title on top
+    canvas.draw()
+    background = canvas.copy_from_bbox(fig.bbox)
+    for i in indices:
+        pos, v = frame_data(frames, meta, i, ring)
+        thetas = 2*np.pi * pos/meta["d_tot"]
+        car_line.set_data(np.cos(thetas), np.sin(thetas))
+        v_line.set_data(range(n), v)
+        title.set_text("k = %i" % (meta["start_k"] + i * meta["every"]))
+        canvas.restore_region(background)
+        car_ax.draw_artist(car_line)
+        v_ax.draw_artist(v_line)
+        fig.draw_artist(title)
+        Image.fromarray(np.asarray(canvas.buffer_rgba())).save(os.path.join(out_dir, FRAME_NAME % i), compress_level=1)
+    return len(indices)
+
+def render_frames(path : str, out_dir : str, start : int = 0, stop : int = None, every : int = 1, ring : int = 0, dpi : int = 100, workers : int = None) -> int:
+    # render frames start:stop:every of the recording at path to PNGs in out_dir, returns the number of frames
+    frames, _ = record.load(path)
+    indices = np.arange(len(frames))[start:stop:every]
+    workers = min(workers or os.cpu_count(), max(1, len(indices)))
+    os.makedirs(out_dir, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        slices = [part.tolist() for part in np.array_split(indices, workers) if len(part)]
+        return sum(pool.map(render_slice, [path] * len(slices), [out_dir] * len(slices), slices, [ring] * len(slices), [dpi] * len(slices)))
+
+def render_video(path : str, out : str, fps : int = 25, **kwargs) -> None:
+    # render the recording to a video file (format from the extension of out), needs ffmpeg
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise RuntimeError("ffmpeg is needed to write videos, use render_frames() for PNG frames")
+    with tempfile.TemporaryDirectory() as tmp:
+        # ffmpeg wants consecutive numbers, so render every frame that should be in the video
+        frames, _ = record.load(path)
+        every = kwargs.pop("every", 1)
+        indices = np.arange(len(frames))[kwargs.pop("start", 0):kwargs.pop("stop", None):every]
+        render_frames(path, tmp, start=indices[0], stop=indices[-1] + 1, every=every, **kwargs)
+        for j, i in enumerate(indices):
+            os.rename(os.path.join(tmp, FRAME_NAME % i), os.path.join(tmp, "video_%06d.png" % j))
+        subprocess.run([ffmpeg, "-y", "-loglevel", "error", "-framerate", str(fps), "-i", os.path.join(tmp, "video_%06d.png"),
+                        "-pix_fmt", "yuv420p", "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", out], check=True)
@@ -0,0 +1,283 @@
+# Simulation in a background process that feeds the live views through shared memory.
+# In draw() the model is stepped inside the matplotlib callbacks, so a slow frame stalls the
+# simulation and a slow step freezes the window. A Simulation instead steps the state in its own
+# process at full speed and publishes snapshots of one ring (positions, speeds, wave speed) into a
+# multiprocessing.shared_memory block, at most every interval ms. Any number of views read the
+# latest snapshot straight from the block, in the process that started the Simulation or in others
+# that attach to it by the name of the block (python -m matmod view NAME).
+#
+# The block is a double buffer: snapshot s goes to slot s % 2. The writer marks the slot as being
+# written (its seq -1), fills it, sets its seq to s and only then published to s, so the slot of
+# published always holds a complete snapshot. A reader gets views of that slot, without copying
+# and without a lock. The writer only starts on that slot again two snapshots later, which the
+# reader sees afterwards from Snapshot.valid() (a seqlock) and then skips the frame.
+
+import multiprocessing
+import time
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+from . import engine
+from . import metrics
+
+# int64 header fields
+PUBLISHED, STOP, DONE, N, SEQ, K = 0, 1, 2, 3, 4, 6
+INTS = 8
+# float64 header fields
+D_TOT, V_TOP, WAVE_SPEED = 0, 1, 2
+FLOATS = 4
+
+# names of the blocks created in this process, by a Simulation
+CREATED = set()
+
+def attach(name : str) -> SharedMemory:
+    # attach to the block of a Simulation without taking ownership of the block
+    try:
+        return SharedMemory(name=name, track=False)
+    except TypeError:
+        # before Python 3.13 attaching registers the block with the resource tracker of the process,
+        # which would unlink it when a process other than the creator exits while the Simulation
+        # still runs. In the creator the registration is the one of the Simulation, which unlinks
+        # the block in close().
+        block = SharedMemory(name=name)
+        if name not in CREATED:
+            resource_tracker.unregister(block._name, "shared_memory")
+        return block
+
+class Snapshot:
+    # views of one slot of the block, valid while the writer has not started on the slot again
+    def __init__(self, snapshots, seq : int) -> None:
+        self.snapshots = snapshots
+        self.seq = seq
+        slot = seq % 2
+        self.k = int(snapshots.ints[K + slot])
+        self.pos = snapshots.pos[slot]
+        self.v = snapshots.v[slot]
+        self.wave_speed = float(snapshots.floats[WAVE_SPEED + slot])
+
+    def __repr__(self) -> str:
+        return "Snapshot(seq=%i, k=%i, valid=%s)" % (self.seq, self.k, self.valid())
+
+    def valid(self) -> bool:
+        # if the views still show this snapshot, check after reading them
+        return self.snapshots.ints[SEQ + self.seq % 2] == self.seq
+
+class Snapshots:
+    # the double buffer in a shared memory block, for the writer and for readers
+    def __init__(self, block : SharedMemory) -> None:
+        self.block = block
+        self.ints = np.ndarray((INTS,), dtype=np.int64, buffer=block.buf)
+        self.floats = np.ndarray((FLOATS,), dtype=np.float64, buffer=block.buf, offset=self.ints.nbytes)
+        self.n = int(self.ints[N])
+        slots = np.ndarray((2, 2, self.n), dtype=np.float64, buffer=block.buf, offset=self.ints.nbytes + self.floats.nbytes)
+        self.pos, self.v = slots[:, 0], slots[:, 1]
+        self.d_tot = float(self.floats[D_TOT])
+        self.v_top = float(self.floats[V_TOP])
+
+    def __repr__(self) -> str:
+        return "Snapshots(name=%s, n=%i, published=%i)" % (self.block.name, self.n, self.ints[PUBLISHED])
+
+    @staticmethod
+    def size(n : int) -> int:
+        return 8 * (INTS + FLOATS + 4 * n)
+
+    @classmethod
+    def attach(cls, name : str) -> "Snapshots":
+        return cls(attach(name))
+
+    @property
+    def stopping(self) -> bool:
+        return bool(self.ints[STOP])
+
+    @property
+    def done(self) -> bool:
+        # if the simulation has ended, the last snapshot stays
+        return bool(self.ints[DONE])
+
+    def latest(self) -> Snapshot | None:
+        # the latest complete snapshot, None before the first one
+        while True:
+            seq = int(self.ints[PUBLISHED])
+            if seq == 0:
+                return None
+            snapshot = Snapshot(self, seq)
+            if snapshot.valid():
+                return snapshot
+
+    def publish(self, state : engine.State, wave_speed : float, ring : int = 0) -> None:
+        # write the state to the free slot, in the units of the models also for fixed point states
+        seq = int(self.ints[PUBLISHED]) + 1
+        slot = seq % 2
+        pos, v = (state.pos, state.v) if state.pos.ndim == 1 else (state.pos[ring], state.v[ring])
+        self.ints[SEQ + slot] = -1
+        np.divide(pos[:self.n], state.unit, out=self.pos[slot])
+        np.divide(v[:self.n], state.scale or 1, out=self.v[slot])
+        self.ints[K + slot] = state.k
+        self.floats[WAVE_SPEED + slot] = wave_speed
+        self.ints[SEQ + slot] = seq
+        self.ints[PUBLISHED] = seq
+
+    def close(self) -> None:
+        # drop the views before the block, which cannot be closed while they exist
+        del self.ints, self.floats, self.pos, self.v
+        self.block.close()
+
+def serve(block : SharedMemory, state : engine.State, interval : int, ring : int, window : int, steps : int) -> None:
+    # the loop of the simulation process: step, and publish whenever interval ms have passed
+    snapshots = Snapshots(block)
+    wave = metrics.WaveMetrics(state, window=window, history=1)
+    index = ring if state.pos.ndim == 2 else 0
+    # speed_mean is in position units per dt units, den / unit brings both back to the models
+    per_time = state.den / state.unit
+    period = interval / 1000
+    # steps counts from the step the state is at, which is not 0 for a resumed state
+    stop = None if steps is None else state.k + steps
+    last = time.perf_counter()
+    try:
+        snapshots.publish(state, np.nan, ring)
+        while not snapshots.stopping and (stop is None or state.k < stop):
+            engine.step(state)
+            wave.update(state)
+            now = time.perf_counter()
+            if now - last >= period:
+                snapshots.publish(state, np.ravel(wave["speed_mean"])[index] * per_time, ring)
+                last = now
+        snapshots.publish(state, np.ravel(wave["speed_mean"])[index] * per_time, ring)
+        snapshots.ints[DONE] = 1
+    finally:
+        snapshots.close()
+
+class Simulation:
+    # Steps state in a background process until stop() (or for steps steps), publishing snapshots of ring to
+    # a new shared memory block. The state in this process is not touched.
+    def __init__(self, state : engine.State, interval : int = 10, ring : int = 0, window : int = 5, steps : int = None) -> None:
+        n = int(state.counts) if state.counts.ndim == 0 else int(state.counts[ring])
+        self.block = SharedMemory(create=True, size=Snapshots.size(n))
+        CREATED.add(self.block.name)
+        ints = np.ndarray((INTS,), dtype=np.int64, buffer=self.block.buf)
+        floats = np.ndarray((FLOATS,), dtype=np.float64, buffer=self.block.buf, offset=ints.nbytes)
+        ints[:] = 0
+        ints[N] = n
+        floats[D_TOT] = state.d_tot / state.unit
+        floats[V_TOP] = float(np.max(state.v_max)) / (state.scale or 1) + 20
+        del ints, floats
+        self.snapshots = Snapshots(self.block)
+        self.process = multiprocessing.Process(target=serve, args=(self.block, state, interval, ring, window, steps), daemon=True)
+
+    def __repr__(self) -> str:
+        return "Simulation(name=%s, alive=%s, published=%i)" % (self.name, self.process.is_alive(), self.snapshots.ints[PUBLISHED])
+
+    @property
+    def name(self) -> str:
+        return self.block.name
+
+    def start(self) -> None:
+        self.process.start()
+
+    def stop(self) -> Snapshot:
+        # stop the simulation process, returns its last snapshot
+        self.snapshots.ints[STOP] = 1
+        if self.process.is_alive():
+            self.process.join()
+        return self.snapshots.latest()
+
+    def close(self) -> None:
+        # stop and free the block, views attached elsewhere keep their mapping until they close it
+        self.stop()
+        self.snapshots.close()
+        self.block.unlink()
+
+def ring_view(snapshots : Snapshots, interval : int = 40):
+    # the cars on the ring road, returns the figure and its animation, which has to be kept alive
+    import matplotlib.pyplot as plt
+    from matplotlib.animation import FuncAnimation
+
+    fig = plt.figure()
+    axis = plt.axes(xlim=(-1.1, 1.1), ylim=(-1.1, 1.1))
+    axis.set_aspect('equal')
+    axis.add_artist(plt.Circle((0, 0), 1, fill=False))
+    line, = axis.plot([], [], "rs")
+    # the step as a text artist, blitting does not redraw the title
+    label = axis.text(0, 0, "", ha="center", va="center")
+    scale = 2*np.pi / snapshots.d_tot
+    seen = [0]
+
+    def animate(frame):
+        snapshot = snapshots.latest()
+        if snapshot is None or snapshot.seq == seen[0]:
+            return ()
+        thetas = snapshot.pos * scale
+        x, y = np.cos(thetas), np.sin(thetas)
+        if not snapshot.valid():
+            return ()
+        seen[0] = snapshot.seq
+        line.set_data(x, y)
+        label.set_text("k = %i" % snapshot.k)
+        return line, label
+
+    return fig, FuncAnimation(fig, animate, interval=interval, blit=True, cache_frame_data=False)
+
+def speeds_view(snapshots : Snapshots, interval : int = 40):
+    # the speed of every car
+    import matplotlib.pyplot as plt
+    from matplotlib.animation import FuncAnimation
+
+    fig = plt.figure()
+    axis = plt.axes(xlim=(0, snapshots.n), ylim=(0, snapshots.v_top))
+    axis.set_title("Speeds")
+    line, = axis.plot([], [])
+    x = np.arange(snapshots.n)
+    seen = [0]
+
+    def animate(frame):
+        snapshot = snapshots.latest()
+        if snapshot is None or snapshot.seq == seen[0]:
+            return ()
+        # set_data copies the speeds, a torn copy is overwritten by the next frame
+        line.set_data(x, snapshot.v)
+        if not snapshot.valid():
+            return ()
+        seen[0] = snapshot.seq
+        return line,
+
+    return fig, FuncAnimation(fig, animate, interval=interval, blit=True, cache_frame_data=False)
+
+def wave_view(snapshots : Snapshots, interval : int = 200, history : int = 1000):
+    # the wave speed (metrics.WaveMetrics speed_mean) of the last history snapshots against k
+    import matplotlib.pyplot as plt
+    from matplotlib.animation import FuncAnimation
+
+    fig = plt.figure()
+    axis = plt.axes()
+    axis.set_title("Wave speed")
+    axis.set_xlabel("step")
+    line, = axis.plot([], [])
+    ks = metrics.RingBuffer(history)
+    speeds = metrics.RingBuffer(history)
+    seen = [0]
+
+    def animate(frame):
+        snapshot = snapshots.latest()
+        if snapshot is None or snapshot.seq == seen[0] or not np.isfinite(snapshot.wave_speed):
+            return ()
+        seen[0] = snapshot.seq
+        ks.append(snapshot.k)
+        speeds.append(snapshot.wave_speed)
+        line.set_data(ks.values(), speeds.values())
+        axis.relim()
+        axis.autoscale_view()
+        return line,
+
+    # the axes rescale, so the whole figure is redrawn (no blitting)
+    return fig, FuncAnimation(fig, animate, interval=interval, cache_frame_data=False)
+
+VIEWS = {"ring": ring_view, "speeds": speeds_view, "wave": wave_view}
+
+def show(snapshots : Snapshots, views : list[str] = tuple(VIEWS)) -> None:
+    # open the views and block until their windows are closed
+    import matplotlib.pyplot as plt
+
+    # the animations stop when they are garbage collected
+    figures = [VIEWS[view](snapshots) for view in views]
+    plt.show()
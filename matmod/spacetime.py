@@ -0,0 +1,63 @@
+# Streaming spacetime (x-t) diagram of the speeds on the ring in constant memory.
+# Every update bins the cars of one ring by position (live.RingBins) and adds them to the current
+# row of fixed (time_bins, space_bins) grids of speed sum, min and car count. A row covers
+# steps_per_row updates. When the rows run out, adjacent rows are merged pairwise, which halves the
+# number of rows in use and doubles steps_per_row, so the grids keep their size whether the run is
+# a thousand or ten million steps long.
+
+import numpy as np
+from .live import RingBins
+
+class Spacetime:
+    def __init__(self, state, time_bins : int = 512, space_bins : int = 256, ring : int = 0) -> None:
+        if time_bins % 2:
+            raise ValueError("time_bins has to be even to merge rows pairwise, not %i" % time_bins)
+        self.bins = RingBins(state, space_bins, ring)
+        self.d_tot = state.d_tot
+        self.time_bins = time_bins
+        self.sum = np.zeros((time_bins, space_bins))
+        self.min = np.full((time_bins, space_bins), np.inf)
+        self.count = np.zeros((time_bins, space_bins), dtype=np.int64)
+        self.steps_per_row = 1
+        self.steps = 0
+        self.start_k = state.k
+
+    def __repr__(self) -> str:
+        return "Spacetime(rows=%i/%i, steps_per_row=%i, steps=%i)" % (self.rows, self.time_bins, self.steps_per_row, self.steps)
+
+    @property
+    def rows(self) -> int:
+        # rows in use, the last one possibly not complete yet
+        return -(-self.steps // self.steps_per_row)
+
+    def _merge(self) -> None:
+        half = self.time_bins // 2
+        self.sum[:half] = self.sum[0::2] + self.sum[1::2]
+        self.min[:half] = np.minimum(self.min[0::2], self.min[1::2])
+        self.count[:half] = self.count[0::2] + self.count[1::2]
+        self.sum[half:], self.min[half:], self.count[half:] = 0, np.inf, 0
+        self.steps_per_row *= 2
+
+    def update(self, state) -> None:
+        # add the state right after a step
+        if self.steps == self.time_bins * self.steps_per_row:
+            self._merge()
+        row = self.steps // self.steps_per_row
+        self.bins.update(state)
+        seen = self.bins.count > 0
+        self.sum[row, seen] += self.bins.mean[seen] * self.bins.count[seen]
+        np.fmin(self.min[row], self.bins.min, out=self.min[row])
+        self.count[row] += self.bins.count.astype(np.int64)
+        self.steps += 1
+
+    def image(self, kind : str = "mean") -> np.ndarray:
+        # (rows, space_bins) mean or min speed of the rows in use, nan where no car was
+        rows = self.rows
+        if kind == "min":
+            return np.where(self.count[:rows] > 0, self.min[:rows], np.nan)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.count[:rows] > 0, self.sum[:rows] / self.count[:rows], np.nan)
+
+    def extent(self) -> tuple[float, float, float, float]:
+        # position and step range of image() for imshow(extent=...)
+        return 0, self.d_tot, self.start_k, self.start_k + self.rows * self.steps_per_row
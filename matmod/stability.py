@@ -0,0 +1,57 @@
+# Adaptive search for the critical value of a parameter of model4 at which the wave persists.
+# Instead of simulating a dense grid, every search bisects the interval [low, high] of one
+# parameter between a value where the wave dies out and one where it persists, a wave being
+# persistent when at least min_size cars are still in it once it has settled. The searches for all
+# points of an outer grid (e.g. the critical v_max for every reaction time) advance together: every
+# round simulates the midpoints of all unfinished searches as one batch through sweep.run, so they
+# run in parallel, come from the cache if they were simulated before, and every point stops as soon
+# as its wave has settled or died out (ensemble.simulate_steady). A search over R values takes
+# 2 + log2(R) simulations instead of R.
+
+import numpy as np
+from . import sweep
+
+def persists(points : list[dict], max_k : int, min_size : int = 1, **options) -> np.ndarray:
+    # if the wave persists with at least min_size cars for every point, options go to sweep.run
+    names = tuple(points[0])
+    sizes, _ = sweep.run({names: [tuple(point[name] for name in names) for point in points]}, None, max_k, **options)
+    return sizes >= min_size
+
+def critical(parameter : str, low, high, over : dict = None, fixed : dict = None, min_size : int = 1, tol=1, max_k : int = 5000, **options) -> tuple[np.ndarray, int]:
+    # The smallest value of parameter in (low, high] at which the wave behaves differently than at
+    # low (persists where it died out at low, or the other way round), within tol, for every point
+    # of the grid over and with the other parameters from fixed. Assumes a single change between
+    # low and high. Returns the critical values in the shape of the grid, nan where the wave behaves
+    # the same at both ends, and the number of simulations it took.
+    outer = sweep.grid_points(over) if over else [{}]
+    fixed = fixed or {}
+    integer = all(isinstance(value, (int, np.integer)) for value in (low, high, tol))
+    if integer:
+        # integer values cannot be closer than 1, with a smaller tol mid would stay at lo forever
+        tol = max(tol, 1)
+    m = len(outer)
+
+    def points(indices, values):
+        return [dict(fixed, **outer[i], **{parameter: int(value) if integer else float(value)}) for i, value in zip(indices, values)]
+
+    lo, hi = np.full(m, low, dtype=float), np.full(m, high, dtype=float)
+    everyone = np.arange(m)
+    ends = persists(points(everyone, lo) + points(everyone, hi), max_k, min_size, **options)
+    at_low = ends[:m]
+    searching = at_low != ends[m:]
+    simulations = 2 * m
+
+    while True:
+        active = np.flatnonzero(searching & (hi - lo > tol))
+        if not len(active):
+            break
+        mid = (lo[active] + hi[active]) / 2
+        if integer:
+            mid = np.floor(mid)
+        same = persists(points(active, mid), max_k, min_size, **options) == at_low[active]
+        lo[active[same]] = mid[same]
+        hi[active[~same]] = mid[~same]
+        simulations += len(active)
+
+    result = np.where(searching, hi, np.nan)
+    return result.reshape(sweep.grid_shape(over)) if over else result[0], simulations
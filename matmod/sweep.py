@@ -0,0 +1,155 @@
+# Parallel parameter sweeps for model4.
+# A grid is a dict from a parameter of model4.setup_cars_set_parameters to its values, e.g.
+#     {"v_max": range(200, 1200, 100), "reaction_time": range(2, 10)}
+# and the sweep runs every point of the Cartesian product. Parameters that should vary together
+# are given as a tuple of names with tuples of values:
+#     {("acceleration", "retardation"): [(acc, -acc) for acc in range(20, 81, 10)]}
+# The points are cut into chunks, every chunk is simulated as one ensemble in a worker process,
+# and the results are put back in grid order. With a cache.Cache only the points that are not in
+# the cache yet are simulated. Without a start_k the points run until their wave has settled, with
+# stop_k as the maximum number of steps (ensemble.simulate_steady).
+#
+# Heterogeneous fleets ("heterogeneous": [True]) are drawn from a np.random.Generator per point,
+# seeded from the seed of the sweep and the cache key of the point, so a point gets the same fleet
+# whatever the grid, chunking or number of workers. "sample": range(1000) is a Monte Carlo axis of
+# 1000 independent fleets with otherwise the same parameters. Without a seed every run draws new
+# fleets, so those points are neither read from nor written to the cache.
+#
+# With spectral=True the wave speed of a fixed window comes from ensemble.simulate_spectral, which
+# needs far fewer steps than the positions of the slowest car.
+#
+# The cars of model4 follow the rule "model4" unless run is given another rule of engine.RULES,
+# with the same fleets, so that the rules can be compared point by point.
+
+import inspect
+import itertools
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from . import engine
+from . import ensemble
+from .cache import key as scenario_key
+
+def grid_shape(grid : dict) -> tuple[int, ...]:
+    return tuple(len(values) for values in grid.values())
+
+def grid_points(grid : dict) -> list[dict]:
+    # the parameters of every grid point, the last axis varying fastest
+    points = []
+    for values in itertools.product(*grid.values()):
+        params = {}
+        for key, value in zip(grid.keys(), values):
+            if isinstance(key, tuple):
+                params.update(zip(key, value))
+            else:
+                params[key] = value
+        points.append(params)
+    return points
+
+def scenario(params : dict, start_k : int, stop_k : int, seed : int = None, spectral : bool = False, rule : str = "model4") -> dict:
+    # everything that determines the result of simulating one grid point, used as the cache key
+    from . import model4
+    params = dict(params)
+    sample = params.pop("sample", 0)
+    bound = inspect.signature(model4.setup_cars_set_parameters).bind(**params)
+    bound.apply_defaults()
+    del bound.arguments["rng"]
+    key = {
+        "params": dict(bound.arguments),
+        "sample": sample,
+        "N": model4.N,
+        "setup_version": model4.SETUP_VERSION,
+        "D_TOT": model4.D_TOT,
+        "DT": model4.DT,
+        "start_k": start_k,
+        "stop_k": stop_k,
+        "seed": seed,
+        "steady": None if start_k is not None else [ensemble.STEADY_WINDOW, ensemble.STEADY_TOL, ensemble.STEADY_MIN_BLOCKS, ensemble.STEADY_SIZE_TOL],
+        "rule": rule,
+        "rule_version": engine.RULE_VERSIONS[rule],
+    }
+    if spectral:
+        key["estimator"] = "spectral"
+    return key
+
+def point_rng(params : dict, start_k : int, stop_k : int, seed : int = None) -> np.random.Generator:
+    # the random stream of one grid point, only depends on the seed and the scenario of the point
+    key = int.from_bytes(scenario_key(scenario(params, start_k, stop_k, seed)), "little")
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(key,)))
+
+def simulate_chunk(index : int, points : list[dict], start_k : int, stop_k : int, seed : int = None, spectral : bool = False, rule : str = "model4") -> tuple:
+    from . import model4
+    start = time.perf_counter()
+    states = []
+    for params in points:
+        rng = point_rng(params, start_k, stop_k, seed) if params.get("heterogeneous") else None
+        state = model4.setup_state(rng=rng, **{name: value for name, value in params.items() if name != "sample"})
+        state.rule = rule
+        states.append(state)
+    if start_k is None:
+        wave_size, wave_speed, _ = ensemble.simulate_steady(states, max_k=stop_k)
+    elif spectral:
+        wave_size, wave_speed = ensemble.simulate_spectral(states, start_k, stop_k)
+    else:
+        wave_size, wave_speed = ensemble.simulate(states, start_k, stop_k)
+    return index, wave_size, wave_speed, os.getpid(), time.perf_counter() - start
+
+def run(grid : dict, start_k : int, stop_k : int, workers : int = None, chunk_size : int = None, cache=None, seed : int = None, verbose : bool = True, spectral : bool = False, rule : str = "model4") -> tuple[np.ndarray, np.ndarray]:
+    # wave size and wave speed for every grid point, as arrays of shape grid_shape(grid)
+    if rule not in engine.RULES:
+        raise ValueError("unknown rule %r, registered are %s" % (rule, ", ".join(engine.RULES)))
+    points = grid_points(grid)
+    wave_size = np.zeros(len(points), dtype=np.int64)
+    wave_speed = np.zeros(len(points))
+
+    missing = list(range(len(points)))
+    if cache is not None:
+        keys = [scenario_key(scenario(params, start_k, stop_k, seed, spectral, rule)) for params in points]
+        # random fleets from fresh entropy are not reproducible, their results are not cached
+        cached = [seed is not None or not params.get("heterogeneous") for params in points]
+        missing = [i for i in range(len(points)) if not cached[i]]
+        results = cache.get_many([key for key, keep in zip(keys, cached) if keep])
+        for i, result in zip([i for i in range(len(points)) if cached[i]], results):
+            if result is None:
+                missing.append(i)
+            else:
+                wave_size[i], wave_speed[i] = result
+        missing.sort()
+        if verbose:
+            print("%i/%i points cached, %i to simulate" % (len(points) - len(missing), len(points), len(missing)))
+    if not missing:
+        return wave_size.reshape(grid_shape(grid)), wave_speed.reshape(grid_shape(grid))
+
+    workers = workers or os.cpu_count()
+    chunk_size = chunk_size or max(1, math.ceil(len(missing) / (4 * workers)))
+    chunks = [missing[i:i + chunk_size] for i in range(0, len(missing), chunk_size)]
+
+    done = 0
+    per_worker = {}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), initializer=engine.import_rules, initargs=(list(engine.RULE_MODULES),)) as pool:
+        futures = [pool.submit(simulate_chunk, i, [points[j] for j in chunk], start_k, stop_k, seed, spectral, rule) for i, chunk in enumerate(chunks)]
+        for future in as_completed(futures):
+            index, sizes, speeds, pid, elapsed = future.result()
+            chunk = chunks[index]
+            wave_size[chunk] = sizes
+            wave_speed[chunk] = speeds
+            if cache is not None:
+                keep = [cached[j] for j in chunk]
+                cache.put_many([keys[j] for j, kept in zip(chunk, keep) if kept], np.asarray(sizes)[keep], np.asarray(speeds)[keep])
+
+            done += len(sizes)
+            n_points, busy = per_worker.get(pid, (0, 0.0))
+            per_worker[pid] = (n_points + len(sizes), busy + elapsed)
+            if verbose:
+                print("worker %i: %i points in %.2fs, %i/%i done" % (pid, len(sizes), elapsed, done, len(missing)))
+
+    if verbose:
+        for pid, (n_points, busy) in per_worker.items():
+            print("worker %i: %i points, busy %.2fs" % (pid, n_points, busy))
+        print("sweep of %i points took %.2fs" % (len(missing), time.perf_counter() - start))
+    shape = grid_shape(grid)
+    return wave_size.reshape(shape), wave_speed.reshape(shape)
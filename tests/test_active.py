@@ -0,0 +1,47 @@
+# ActiveSet against engine.step: the speeds have to be exactly the same, positions in floats up to
+# the last bits of the closed form advance of sleeping cars, in fixed point exactly.
+
+import copy
+
+import numpy as np
+import pytest
+from matmod import active, engine, model4
+
+STEPS = 1500
+
+def ring(rule : str, n : int, reaction_time : int, faster : int, scale : int) -> engine.State:
+    # the ring of model4 with car 120 faster (or slower) than the others, so its followers see a
+    # car in front with another v_max
+    state = model4.setup_state(n=n, reaction_time=reaction_time)
+    state.rule = rule
+    state.v_max[120] += faster
+    state.v[120] += faster
+    state.hist_v[:, 120] += faster
+    return state.rescaled(scale) if scale else state
+
+@pytest.mark.parametrize("scale", [None, 10])
+@pytest.mark.parametrize("faster", [0, 50, -30])
+@pytest.mark.parametrize("reaction_time", [1, 4])
+@pytest.mark.parametrize("rule", sorted(engine.FREE_FLOW_RULES))
+def test_matches_engine_step(rule, reaction_time, faster, scale):
+    state = ring(rule, 400, reaction_time, faster, scale)
+    reference = copy.deepcopy(state)
+    stepper = active.ActiveSet(state)
+    for k in range(STEPS):
+        stepper.step()
+        engine.step(reference)
+        assert np.array_equal(state.v, reference.v), k
+        if k % 100 == 0:
+            stepper.sync()
+            if scale:
+                assert np.array_equal(state.pos, reference.pos), k
+            else:
+                np.testing.assert_allclose(state.pos, reference.pos, rtol=0, atol=1e-6)
+            assert np.array_equal(state.lap, reference.lap), k
+
+def test_refuses_rules_without_free_flow(monkeypatch):
+    monkeypatch.setitem(engine.RULES, "unknown", engine.move_model3)
+    state = model4.setup_state()
+    state.rule = "unknown"
+    with pytest.raises(ValueError):
+        active.ActiveSet(state)
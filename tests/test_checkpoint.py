@@ -0,0 +1,43 @@
+# A run restored from a checkpoint has to continue bit for bit like the run that saved it.
+
+import numpy as np
+import pytest
+from matmod import checkpoint, engine, model4
+
+STEPS = 500
+
+def assert_same(state : engine.State, other : engine.State) -> None:
+    assert state.k == other.k and state.scale == other.scale
+    assert state.pos.dtype == other.pos.dtype
+    for name in ("pos", "v", "lap", "hist_v", "hist_pos"):
+        assert np.array_equal(getattr(state, name), getattr(other, name)), name
+    for k in range(state.r_max):
+        assert np.array_equal(state.memory(k)[0], other.memory(k)[0]), k
+        assert np.array_equal(state.memory(k)[1], other.memory(k)[1]), k
+
+@pytest.mark.parametrize("rule, scale", [("model4", None), ("model2", 10)])
+def test_load_continues_the_run(rule, scale, tmp_path):
+    state = model4.setup_state(reaction_time=4, heterogeneous=True, rng=np.random.default_rng(8))
+    state.rule = rule
+    if scale:
+        state = state.rescaled(scale)
+    # a few steps so the head of the history is not at its start
+    engine.run(state, STEPS + 3)
+    path = str(tmp_path / "mid.npz")
+    checkpoint.save(state, path)
+    loaded = checkpoint.load(path)
+    assert_same(loaded, state)
+    engine.run(state, STEPS)
+    engine.run(loaded, STEPS)
+    assert_same(loaded, state)
+
+def test_checkpointer_keeps_the_latest(tmp_path):
+    state = model4.setup_state(n=50)
+    pattern = str(tmp_path / "run_%08i.npz")
+    checkpointer = checkpoint.Checkpointer(pattern, 100)
+    for _ in range(350):
+        engine.step(state)
+        checkpointer(state)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["run_00000200.npz", "run_00000300.npz"]
+    assert checkpoint.latest(pattern) == pattern % 300
+    assert checkpoint.load(checkpoint.latest(pattern)).k == 300
@@ -0,0 +1,85 @@
+# The engine against the per-car Car/move() code of the models it replaced: both are stepped side
+# by side from the same ring and have to give bit for bit the same speeds and positions.
+
+import numpy as np
+import pytest
+from matmod import engine, ensemble, model1, model2, model3, model4
+
+STEPS = 500
+
+def vary(model, cars, seed : int) -> list:
+    # give the cars of a homogeneous set up their own v_max and reaction time, with a history of the
+    # current speeds and positions
+    rng = np.random.default_rng(seed)
+    for car in cars:
+        car.v_max = car.v_max + int(rng.integers(-20, 21))
+        car.r = int(rng.integers(1, 6))
+    return [[model.MemCell(car.v, car.pos) for car in cars] for _ in range(max(car.r for car in cars))]
+
+def legacy_ring(name : str, heterogeneous : bool, monkeypatch) -> tuple:
+    # cars, memory and a function that steps them with the model's own update()
+    match name:
+        case "model1":
+            cars, memory = model1.setup_cars()
+            if heterogeneous:
+                memory = vary(model1, cars, 1)
+            return cars, memory, model1.D_TOT, model1.dt, lambda: model1.update(cars, memory)
+        case "model3":
+            monkeypatch.setattr(model3, "HETEROGENEOUS", heterogeneous)
+            monkeypatch.setattr(model3, "SEED", 3)
+            cars, memory = model3.setup_cars()
+            return cars, memory, model3.D_TOT, model3.DT, lambda: model3.update(cars, memory)
+        case "model4":
+            cars, memory = model4.setup_cars_set_parameters(n=80, heterogeneous=heterogeneous, rng=np.random.default_rng(4))
+            return cars, memory, model4.D_TOT, model4.DT, lambda: model4.update(cars, memory, n=len(cars))
+
+def assert_same(state : engine.State, cars : list, memory : list, k : int) -> None:
+    assert np.array_equal(state.v, [car.v for car in cars]), k
+    assert np.array_equal(state.pos, [car.pos for car in cars]), k
+    for j, row in enumerate(memory):
+        assert np.array_equal(state.memory(j)[0], [cell.v for cell in row]), (k, j)
+
+@pytest.mark.parametrize("heterogeneous", [False, True])
+@pytest.mark.parametrize("name", ["model1", "model3", "model4"])
+def test_matches_legacy_update(name, heterogeneous, monkeypatch):
+    cars, memory, d_tot, dt, update = legacy_ring(name, heterogeneous, monkeypatch)
+    state = engine.from_cars(cars, memory, d_tot, dt, rule=name)
+    for k in range(STEPS):
+        update()
+        engine.step(state)
+        assert_same(state, cars, memory, k)
+
+@pytest.mark.parametrize("heterogeneous", [False, True])
+def test_model2_matches_legacy_move(heterogeneous):
+    # model2.update() moves the cars one after the other and the last one sees the already moved
+    # first car, the engine takes the gaps of all cars at the start of the step. So move() is given
+    # the car in front as it was at the start of the step.
+    cars, memory = model2.setup_cars()
+    if heterogeneous:
+        memory = vary(model2, cars, 2)
+    state = engine.from_cars(cars, memory, model2.D_TOT, model2.DT, rule="model2")
+    n = len(cars)
+    for k in range(STEPS):
+        before = [model2.MemCell(car.v, car.pos) for car in cars]
+        for i, car in enumerate(cars):
+            model2.move(car, memory[car.r - 1][(i + 1) % n], before[(i + 1) % n], model2.DT)
+        model2.update_mem(memory, before)
+        engine.step(state)
+        assert_same(state, cars, memory, k)
+
+@pytest.mark.parametrize("rule", sorted(engine.RULES))
+def test_ensemble_padding_matches_single_rings(rule):
+    # rings of different sizes and fleets stepped as one padded batch, against each ring on its own
+    rng = np.random.default_rng(5)
+    states = [model4.setup_state(n=n, reaction_time=r, heterogeneous=True, rng=rng) for n, r in ((30, 2), (50, 6), (41, 4))]
+    for state in states:
+        state.rule = rule
+    batch = ensemble.stack(states)
+    for k in range(STEPS):
+        engine.step(batch)
+        for state in states:
+            engine.step(state)
+    for j, state in enumerate(states):
+        assert np.array_equal(batch.v[j, :state.n], state.v)
+        assert np.array_equal(batch.pos[j, :state.n], state.pos)
+        assert np.array_equal(batch.lap[j, :state.n], state.lap)
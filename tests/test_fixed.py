@@ -0,0 +1,63 @@
+# Fixed point states (engine.State with a scale): padded batches against the rings stepped on their
+# own, which have to give the same integers, and the conversion back to floats against float runs.
+
+import numpy as np
+import pytest
+from matmod import engine, ensemble, model4
+
+STEPS = 1000
+SCALE = 10
+
+def rings(rule : str, heterogeneous : bool) -> list[engine.State]:
+    # rings of different sizes, speeds and reaction times, with fleets of their own if heterogeneous
+    rng = np.random.default_rng(7)
+    states = [model4.setup_state(n=n, v_max=v_max, reaction_time=r, heterogeneous=heterogeneous, rng=rng)
+              for n, v_max, r in ((30, 380, 2), (50, 400, 6), (41, 430, 4))]
+    for state in states:
+        state.rule = rule
+    return states
+
+def assert_rows_equal(batch : engine.State, states : list[engine.State]) -> None:
+    for j, state in enumerate(states):
+        assert np.array_equal(batch.v[j, :state.n], state.v), j
+        assert np.array_equal(batch.pos[j, :state.n], state.pos), j
+        assert np.array_equal(batch.lap[j, :state.n], state.lap), j
+        for k in range(state.r_max):
+            assert np.array_equal(batch.memory(k)[0][j, :state.n], state.memory(k)[0]), (j, k)
+            assert np.array_equal(batch.memory(k)[1][j, :state.n], state.memory(k)[1]), (j, k)
+
+@pytest.mark.parametrize("rule", sorted(engine.RULES))
+def test_stack_matches_single_rings(rule):
+    states = [state.rescaled(SCALE) for state in rings(rule, heterogeneous=True)]
+    batch = ensemble.stack(states)
+    assert batch.scale == SCALE and np.issubdtype(batch.pos.dtype, np.integer)
+    for k in range(STEPS):
+        engine.step(batch)
+        for state in states:
+            engine.step(state)
+    assert_rows_equal(batch, states)
+    # dropping rings keeps the others exact
+    batch = ensemble.select(batch, [2, 0])
+    states = [states[2], states[0]]
+    for k in range(STEPS):
+        engine.step(batch)
+        for state in states:
+            engine.step(state)
+    assert_rows_equal(batch, states)
+
+@pytest.mark.parametrize("rule", sorted(engine.RULES))
+def test_to_float_matches_float_run(rule):
+    # Every ring is homogeneous here: with fleets of their own a*dt is no exact float (e.g. 5.4), and
+    # the float run, not the fixed point one, drifts off the exact speeds.
+    floats = rings(rule, heterogeneous=False)
+    batch = ensemble.stack([state.rescaled(SCALE) for state in floats])
+    for k in range(STEPS):
+        engine.step(batch)
+        for state in floats:
+            engine.step(state)
+    back = batch.to_float()
+    assert back.scale is None and back.k == STEPS
+    for j, state in enumerate(floats):
+        assert np.array_equal(back.v[j, :state.n], state.v), j
+        np.testing.assert_allclose(back.pos[j, :state.n], state.pos, rtol=0, atol=1e-6)
+        assert np.array_equal(back.lap[j, :state.n], state.lap), j